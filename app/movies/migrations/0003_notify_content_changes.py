@@ -0,0 +1,40 @@
+from django.db import migrations
+
+TABLES = ('film_work', 'person', 'genre')
+
+CREATE_FUNCTION = """
+    CREATE OR REPLACE FUNCTION content.notify_content_changes() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('content_changes', TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+CREATE_TRIGGER = """
+    CREATE TRIGGER {table}_notify_changes
+    AFTER INSERT OR UPDATE ON content.{table}
+    FOR EACH STATEMENT EXECUTE FUNCTION content.notify_content_changes();
+"""
+
+DROP_TRIGGER = 'DROP TRIGGER IF EXISTS {table}_notify_changes ON content.{table};'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_modified_id_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_FUNCTION,
+            reverse_sql='DROP FUNCTION IF EXISTS content.notify_content_changes();',
+        ),
+    ] + [
+        migrations.RunSQL(
+            sql=CREATE_TRIGGER.format(table=table),
+            reverse_sql=DROP_TRIGGER.format(table=table),
+        )
+        for table in TABLES
+    ]
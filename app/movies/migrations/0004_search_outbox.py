@@ -0,0 +1,134 @@
+from django.db import migrations
+
+CREATE_OUTBOX = """
+    CREATE TABLE IF NOT EXISTS content.search_outbox (
+        id bigserial PRIMARY KEY,
+        film_work_id uuid NOT NULL,
+        created timestamp with time zone NOT NULL DEFAULT now()
+    );
+"""
+
+CREATE_FUNCTIONS = """
+    CREATE OR REPLACE FUNCTION content.search_outbox_film_work() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO content.search_outbox (film_work_id) VALUES (OLD.id);
+        ELSE
+            INSERT INTO content.search_outbox (film_work_id) VALUES (NEW.id);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION content.search_outbox_person() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO content.search_outbox (film_work_id)
+        SELECT DISTINCT film_work_id FROM content.person_film_work WHERE person_id = NEW.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION content.search_outbox_genre() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO content.search_outbox (film_work_id)
+        SELECT DISTINCT film_work_id FROM content.genre_film_work WHERE genre_id = NEW.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION content.search_outbox_link() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO content.search_outbox (film_work_id) VALUES (OLD.film_work_id);
+        ELSE
+            INSERT INTO content.search_outbox (film_work_id) VALUES (NEW.film_work_id);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+DROP_FUNCTIONS = """
+    DROP FUNCTION IF EXISTS content.search_outbox_film_work();
+    DROP FUNCTION IF EXISTS content.search_outbox_person();
+    DROP FUNCTION IF EXISTS content.search_outbox_genre();
+    DROP FUNCTION IF EXISTS content.search_outbox_link();
+"""
+
+TRIGGERS = (
+    ('film_work', 'INSERT OR UPDATE OR DELETE', 'search_outbox_film_work'),
+    ('person', 'UPDATE', 'search_outbox_person'),
+    ('genre', 'UPDATE', 'search_outbox_genre'),
+    ('person_film_work', 'INSERT OR UPDATE OR DELETE', 'search_outbox_link'),
+    ('genre_film_work', 'INSERT OR UPDATE OR DELETE', 'search_outbox_link'),
+)
+
+DROP_TRIGGER = 'DROP TRIGGER IF EXISTS {table}_search_outbox ON content.{table};'
+
+# pg_trigger is checked first, so an installed trigger takes no table lock. A trigger
+# created concurrently by another consumer is a duplicate_object error.
+ENSURE_TRIGGER = """
+        IF NOT EXISTS (
+            SELECT FROM pg_trigger
+            WHERE tgname = '{table}_search_outbox' AND tgrelid = 'content.{table}'::regclass
+        ) THEN
+            BEGIN
+                CREATE TRIGGER {table}_search_outbox
+                AFTER {events} ON content.{table}
+                FOR EACH ROW EXECUTE FUNCTION content.{function}();
+            EXCEPTION WHEN duplicate_object THEN
+                NULL;
+            END;
+        END IF;
+"""
+
+# The outbox consumer installs the missing triggers on start, other modes pay neither
+# the outbox writes nor the growing table. disable_search_outbox() turns the outbox off.
+CREATE_SWITCH_FUNCTIONS = """
+    CREATE OR REPLACE FUNCTION content.enable_search_outbox() RETURNS void AS $$
+    BEGIN
+        {ensure_triggers}
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION content.disable_search_outbox() RETURNS void AS $$
+    BEGIN
+        {drop_triggers}
+        DELETE FROM content.search_outbox;
+    END;
+    $$ LANGUAGE plpgsql;
+""".format(
+    drop_triggers=''.join(DROP_TRIGGER.format(table=table) for table, _, _ in TRIGGERS),
+    ensure_triggers=''.join(
+        ENSURE_TRIGGER.format(table=table, events=events, function=function)
+        for table, events, function in TRIGGERS
+    ),
+)
+
+DROP_SWITCH_FUNCTIONS = """
+    SELECT content.disable_search_outbox();
+    DROP FUNCTION IF EXISTS content.enable_search_outbox();
+    DROP FUNCTION IF EXISTS content.disable_search_outbox();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_notify_content_changes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_OUTBOX,
+            reverse_sql='DROP TABLE IF EXISTS content.search_outbox;',
+        ),
+        migrations.RunSQL(
+            sql=CREATE_FUNCTIONS,
+            reverse_sql=DROP_FUNCTIONS,
+        ),
+        migrations.RunSQL(
+            sql=CREATE_SWITCH_FUNCTIONS,
+            reverse_sql=DROP_SWITCH_FUNCTIONS,
+        ),
+    ]
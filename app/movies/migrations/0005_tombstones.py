@@ -0,0 +1,83 @@
+from django.db import migrations
+
+CREATE_TOMBSTONE = """
+    CREATE TABLE IF NOT EXISTS content.tombstone (
+        id uuid PRIMARY KEY DEFAULT md5(random()::text || clock_timestamp()::text)::uuid,
+        table_name text NOT NULL,
+        record_id uuid NOT NULL,
+        film_work_id uuid NOT NULL,
+        deleted_at timestamp with time zone NOT NULL DEFAULT now()
+    );
+    CREATE INDEX IF NOT EXISTS tombstone_deleted_at_id_idx ON content.tombstone (deleted_at, id);
+"""
+
+CREATE_FUNCTIONS = """
+    CREATE OR REPLACE FUNCTION content.tombstone_film_work() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO content.tombstone (table_name, record_id, film_work_id)
+        VALUES (TG_TABLE_NAME, OLD.id, OLD.id);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION content.tombstone_link() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO content.tombstone (table_name, record_id, film_work_id)
+        VALUES (TG_TABLE_NAME, OLD.id, OLD.film_work_id);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+DROP_FUNCTIONS = """
+    DROP FUNCTION IF EXISTS content.tombstone_film_work();
+    DROP FUNCTION IF EXISTS content.tombstone_link();
+"""
+
+TRIGGERS = (
+    ('film_work', 'tombstone', 'tombstone_film_work'),
+    ('person_film_work', 'tombstone', 'tombstone_link'),
+    ('genre_film_work', 'tombstone', 'tombstone_link'),
+)
+
+CREATE_TRIGGER = """
+    CREATE TRIGGER {table}_{name}
+    AFTER DELETE ON content.{table}
+    FOR EACH ROW EXECUTE FUNCTION content.{function}();
+"""
+
+DROP_TRIGGER = 'DROP TRIGGER IF EXISTS {table}_{name} ON content.{table};'
+
+CREATE_NOTIFY_TRIGGER = """
+    CREATE TRIGGER tombstone_notify_changes
+    AFTER INSERT ON content.tombstone
+    FOR EACH STATEMENT EXECUTE FUNCTION content.notify_content_changes();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_search_outbox'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_TOMBSTONE,
+            reverse_sql='DROP TABLE IF EXISTS content.tombstone;',
+        ),
+        migrations.RunSQL(
+            sql=CREATE_FUNCTIONS,
+            reverse_sql=DROP_FUNCTIONS,
+        ),
+        migrations.RunSQL(
+            sql=CREATE_NOTIFY_TRIGGER,
+            reverse_sql='DROP TRIGGER IF EXISTS tombstone_notify_changes ON content.tombstone;',
+        ),
+    ] + [
+        migrations.RunSQL(
+            sql=CREATE_TRIGGER.format(table=table, name=name, function=function),
+            reverse_sql=DROP_TRIGGER.format(table=table, name=name),
+        )
+        for table, name, function in TRIGGERS
+    ]
@@ -0,0 +1,224 @@
+from django.db import migrations
+
+CREATE_SEARCH_DOC = """
+    CREATE TABLE IF NOT EXISTS content.movie_search_doc (
+        id uuid PRIMARY KEY,
+        document jsonb,
+        modified timestamp with time zone NOT NULL DEFAULT now()
+    );
+    CREATE INDEX IF NOT EXISTS movie_search_doc_modified_id_idx ON content.movie_search_doc (modified, id);
+"""
+
+CREATE_FUNCTIONS = """
+    CREATE OR REPLACE FUNCTION content.refresh_movie_search_docs(film_ids uuid[]) RETURNS void AS $$
+    BEGIN
+        INSERT INTO content.movie_search_doc (id, document, modified)
+        SELECT
+            film_work.id,
+            jsonb_build_object(
+                'id', film_work.id,
+                'imdb_rating', film_work.rating::float,
+                'genre', COALESCE(genres.genre, '{}'),
+                'title', film_work.title,
+                'description', film_work.description,
+                'director', COALESCE(persons.director, '{}'),
+                'actors_names', COALESCE(persons.actors_names, '{}'),
+                'writers_names', COALESCE(persons.writers_names, '{}'),
+                'actors', COALESCE(persons.actors, '[]'),
+                'writers', COALESCE(persons.writers, '[]')
+            ),
+            now()
+        FROM content.film_work
+            LEFT JOIN LATERAL (
+                SELECT
+                    array_agg(person.full_name) FILTER (WHERE pfw.role = 'director') as director,
+                    array_agg(person.full_name) FILTER (WHERE pfw.role = 'actor') as actors_names,
+                    array_agg(person.full_name) FILTER (WHERE pfw.role = 'writer') as writers_names,
+                    json_agg(json_build_object('id', person.id, 'name', person.full_name))
+                        FILTER (WHERE pfw.role = 'actor') as actors,
+                    json_agg(json_build_object('id', person.id, 'name', person.full_name))
+                        FILTER (WHERE pfw.role = 'writer') as writers
+                FROM content.person_film_work pfw
+                    JOIN content.person ON person.id = pfw.person_id
+                WHERE pfw.film_work_id = film_work.id
+            ) persons ON true
+            LEFT JOIN LATERAL (
+                SELECT array_agg(DISTINCT genre.name) as genre
+                FROM content.genre_film_work gfw
+                    JOIN content.genre ON genre.id = gfw.genre_id
+                WHERE gfw.film_work_id = film_work.id
+            ) genres ON true
+        WHERE film_work.id = ANY(film_ids)
+        ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document, modified = EXCLUDED.modified;
+
+        UPDATE content.movie_search_doc SET document = NULL, modified = now()
+        WHERE id = ANY(film_ids)
+        AND document IS NOT NULL
+        AND NOT EXISTS (SELECT FROM content.film_work WHERE film_work.id = movie_search_doc.id);
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION content.movie_search_doc_film_work() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM content.refresh_movie_search_docs(ARRAY(SELECT id FROM old_rows));
+        ELSE
+            PERFORM content.refresh_movie_search_docs(ARRAY(SELECT id FROM new_rows));
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION content.movie_search_doc_link() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM content.refresh_movie_search_docs(ARRAY(SELECT DISTINCT film_work_id FROM new_rows));
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM content.refresh_movie_search_docs(ARRAY(SELECT DISTINCT film_work_id FROM old_rows));
+        ELSE
+            PERFORM content.refresh_movie_search_docs(ARRAY(
+                SELECT film_work_id FROM new_rows UNION SELECT film_work_id FROM old_rows
+            ));
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION content.movie_search_doc_person() RETURNS trigger AS $$
+    BEGIN
+        PERFORM content.refresh_movie_search_docs(ARRAY(
+            SELECT DISTINCT pfw.film_work_id
+            FROM new_rows
+                JOIN old_rows ON old_rows.id = new_rows.id
+                JOIN content.person_film_work pfw ON pfw.person_id = new_rows.id
+            WHERE new_rows.full_name IS DISTINCT FROM old_rows.full_name
+        ));
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION content.movie_search_doc_genre() RETURNS trigger AS $$
+    BEGIN
+        PERFORM content.refresh_movie_search_docs(ARRAY(
+            SELECT DISTINCT gfw.film_work_id
+            FROM new_rows
+                JOIN old_rows ON old_rows.id = new_rows.id
+                JOIN content.genre_film_work gfw ON gfw.genre_id = new_rows.id
+            WHERE new_rows.name IS DISTINCT FROM old_rows.name
+        ));
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+DROP_FUNCTIONS = """
+    DROP FUNCTION IF EXISTS content.movie_search_doc_film_work();
+    DROP FUNCTION IF EXISTS content.movie_search_doc_link();
+    DROP FUNCTION IF EXISTS content.movie_search_doc_person();
+    DROP FUNCTION IF EXISTS content.movie_search_doc_genre();
+    DROP FUNCTION IF EXISTS content.refresh_movie_search_docs(uuid[]);
+"""
+
+NEW_ROWS = 'NEW TABLE AS new_rows'
+OLD_ROWS = 'OLD TABLE AS old_rows'
+
+# Transition tables are allowed only in the triggers of one event.
+TRIGGERS = (
+    ('film_work', 'INSERT', NEW_ROWS, 'movie_search_doc_film_work'),
+    ('film_work', 'UPDATE', NEW_ROWS, 'movie_search_doc_film_work'),
+    ('film_work', 'DELETE', OLD_ROWS, 'movie_search_doc_film_work'),
+    ('person', 'UPDATE', ' '.join((OLD_ROWS, NEW_ROWS)), 'movie_search_doc_person'),
+    ('genre', 'UPDATE', ' '.join((OLD_ROWS, NEW_ROWS)), 'movie_search_doc_genre'),
+    ('person_film_work', 'INSERT', NEW_ROWS, 'movie_search_doc_link'),
+    ('person_film_work', 'UPDATE', ' '.join((OLD_ROWS, NEW_ROWS)), 'movie_search_doc_link'),
+    ('person_film_work', 'DELETE', OLD_ROWS, 'movie_search_doc_link'),
+    ('genre_film_work', 'INSERT', NEW_ROWS, 'movie_search_doc_link'),
+    ('genre_film_work', 'UPDATE', ' '.join((OLD_ROWS, NEW_ROWS)), 'movie_search_doc_link'),
+    ('genre_film_work', 'DELETE', OLD_ROWS, 'movie_search_doc_link'),
+)
+
+DROP_TRIGGER = 'DROP TRIGGER IF EXISTS {table}_movie_search_doc_{event_name} ON content.{table};'
+
+# pg_trigger is checked first, so an installed trigger takes no table lock. A trigger
+# created concurrently by another reader is a duplicate_object error.
+ENSURE_TRIGGER = """
+        IF NOT EXISTS (
+            SELECT FROM pg_trigger
+            WHERE tgname = '{table}_movie_search_doc_{event_name}' AND tgrelid = 'content.{table}'::regclass
+        ) THEN
+            BEGIN
+                CREATE TRIGGER {table}_movie_search_doc_{event_name}
+                AFTER {event} ON content.{table}
+                REFERENCING {transition}
+                FOR EACH STATEMENT EXECUTE FUNCTION content.{function}();
+                installed := true;
+            EXCEPTION WHEN duplicate_object THEN
+                NULL;
+            END;
+        END IF;
+"""
+
+# The search document reader installs the missing triggers on start, other modes do not
+# pay the aggregation on every write. The documents are filled when the triggers are
+# installed, changes made while they were off are in the fill. disable_movie_search_doc()
+# turns the documents off.
+CREATE_SWITCH_FUNCTIONS = """
+    CREATE OR REPLACE FUNCTION content.enable_movie_search_doc() RETURNS boolean AS $$
+    DECLARE
+        installed boolean := false;
+    BEGIN
+        {ensure_triggers}
+        IF installed THEN
+            PERFORM content.refresh_movie_search_docs(ARRAY(
+                SELECT id FROM content.film_work UNION SELECT id FROM content.movie_search_doc
+            ));
+        END IF;
+        RETURN installed;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION content.disable_movie_search_doc() RETURNS void AS $$
+    BEGIN
+        {drop_triggers}
+        DELETE FROM content.movie_search_doc;
+    END;
+    $$ LANGUAGE plpgsql;
+""".format(
+    drop_triggers=''.join(
+        DROP_TRIGGER.format(table=table, event_name=event.lower()) for table, event, _, _ in TRIGGERS
+    ),
+    ensure_triggers=''.join(
+        ENSURE_TRIGGER.format(
+            table=table, event=event, event_name=event.lower(), transition=transition, function=function,
+        )
+        for table, event, transition, function in TRIGGERS
+    ),
+)
+
+DROP_SWITCH_FUNCTIONS = """
+    SELECT content.disable_movie_search_doc();
+    DROP FUNCTION IF EXISTS content.enable_movie_search_doc();
+    DROP FUNCTION IF EXISTS content.disable_movie_search_doc();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_tombstones'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_SEARCH_DOC,
+            reverse_sql='DROP TABLE IF EXISTS content.movie_search_doc;',
+        ),
+        migrations.RunSQL(
+            sql=CREATE_FUNCTIONS,
+            reverse_sql=DROP_FUNCTIONS,
+        ),
+        migrations.RunSQL(
+            sql=CREATE_SWITCH_FUNCTIONS,
+            reverse_sql=DROP_SWITCH_FUNCTIONS,
+        ),
+    ]
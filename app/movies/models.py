@@ -30,6 +30,9 @@ class Genre(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"genre"
         verbose_name = _('Genre')
         verbose_name_plural = _('Genres')
+        indexes = [
+            models.Index(fields=['modified', 'id'], name='genre_modified_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -43,6 +46,9 @@ class Person(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"person"
         verbose_name = _('Person')
         verbose_name_plural = _('Persons')
+        indexes = [
+            models.Index(fields=['modified', 'id'], name='person_modified_id_idx'),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -68,6 +74,9 @@ class Filmwork(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"film_work"
         verbose_name = _('Movie')
         verbose_name_plural = _('Movies')
+        indexes = [
+            models.Index(fields=['modified', 'id'], name='film_work_modified_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
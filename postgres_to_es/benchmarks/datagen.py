@@ -0,0 +1,258 @@
+"""Fill the content schema of a local Postgres with synthetic movies.
+
+The schema is created by the Django migrations of the admin panel. Existing
+content is truncated. Person popularity follows a power law, so a few actors
+play in thousands of movies, like in real catalogs.
+
+Usage:
+    python benchmarks/datagen.py --films 100000 --persons 50000 --genres 30
+
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'etl'))
+for variable in ('DB_NAME', 'DB_USER', 'DB_PASSWORD', 'REDIS_PASSWORD'):
+    os.environ.setdefault(variable, 'benchmark')
+
+import psycopg2  # noqa: E402
+from config import settings  # noqa: E402
+
+COPY_BATCH = 50000
+DISABLE_SEARCH_DOC = 'SELECT content.disable_movie_search_doc()'
+TABLES = ('genre_film_work', 'person_film_work', 'film_work', 'person', 'genre')
+
+# Count of persons of the role in one movie: (min, max).
+ROLE_COUNTS = (
+    ('director', 1, 2),
+    ('writer', 1, 3),
+    ('actor', 3, 15),
+)
+
+
+class Generator(object):
+    """Generate rows of the content tables.
+
+    Attributes:
+        random: Seeded random generator.
+        now: Upper bound of the modified dates.
+
+    """
+
+    def __init__(self, seed: int = 0) -> None:
+        """Generator class constructor.
+
+        Args:
+            seed: Seed of the random generator.
+
+        """
+        self.random = random.Random(seed)
+        self.now = datetime.now(timezone.utc)
+
+    def uuid(self) -> str:
+        """Generate a reproducible UUID.
+
+        Returns:
+            str: UUID.
+
+        """
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def timestamps(self) -> Tuple[str, str]:
+        """Generate created and modified dates within the last year.
+
+        Returns:
+            Tuple[str, str]: Created and modified timestamps.
+
+        """
+        modified = self.now - timedelta(seconds=self.random.randrange(365 * 24 * 3600))
+        created = modified - timedelta(seconds=self.random.randrange(365 * 24 * 3600))
+        return created.isoformat(), modified.isoformat()
+
+    def popular(self, count: int, skew: float) -> int:
+        """Pick an index, lower indices are picked much more often.
+
+        Args:
+            count: Count of the items.
+            skew: Power of the distribution, 1 is uniform.
+
+        Returns:
+            int: Index of the item.
+
+        """
+        return int(count * self.random.random() ** skew)
+
+    def rows(self, genre_ids: List[str], person_ids: List[str], film_ids: List[str]) -> dict:
+        """Generate rows of all the tables.
+
+        Args:
+            genre_ids: Ids of the genres.
+            person_ids: Ids of the persons.
+            film_ids: Ids of the film works.
+
+        Returns:
+            dict: Row iterators by the table name.
+
+        """
+        return {
+            'genre': (
+                (genre_id, 'Genre {0}'.format(idx), 'Description of the genre {0}'.format(idx), *self.timestamps())
+                for idx, genre_id in enumerate(genre_ids)
+            ),
+            'person': (
+                (person_id, 'Person {0}'.format(idx), *self.timestamps())
+                for idx, person_id in enumerate(person_ids)
+            ),
+            'film_work': (
+                (
+                    film_id,
+                    'Movie {0}'.format(idx),
+                    'Description of the movie {0}. '.format(idx) * self.random.randint(1, 10),
+                    self.random.choice(('movie', 'tv_show')),
+                    '{0:.1f}'.format(self.random.uniform(1, 10)),
+                    *self.timestamps(),
+                )
+                for idx, film_id in enumerate(film_ids)
+            ),
+            'genre_film_work': self.genre_links(genre_ids, film_ids),
+            'person_film_work': self.person_links(person_ids, film_ids),
+        }
+
+    def genre_links(self, genre_ids: List[str], film_ids: List[str]) -> Iterable[tuple]:
+        """Generate 1-3 genres for every movie.
+
+        Args:
+            genre_ids: Ids of the genres.
+            film_ids: Ids of the film works.
+
+        Yields:
+            tuple: Row of the genre_film_work table.
+
+        """
+        for film_id in film_ids:
+            picked = {self.popular(len(genre_ids), 2) for _ in range(self.random.randint(1, 3))}
+            for idx in picked:
+                yield self.uuid(), film_id, genre_ids[idx], self.now.isoformat()
+
+    def person_links(self, person_ids: List[str], film_ids: List[str]) -> Iterable[tuple]:
+        """Generate directors, writers and actors for every movie.
+
+        Args:
+            person_ids: Ids of the persons.
+            film_ids: Ids of the film works.
+
+        Yields:
+            tuple: Row of the person_film_work table.
+
+        """
+        for film_id in film_ids:
+            for role, min_count, max_count in ROLE_COUNTS:
+                picked = {self.popular(len(person_ids), 3) for _ in range(self.random.randint(min_count, max_count))}
+                for idx in picked:
+                    yield self.uuid(), film_id, person_ids[idx], role, self.now.isoformat()
+
+
+COLUMNS = {
+    'genre': 'id, name, description, created, modified',
+    'person': 'id, full_name, created, modified',
+    'film_work': 'id, title, description, type, rating, created, modified',
+    'genre_film_work': 'id, film_work_id, genre_id, created',
+    'person_film_work': 'id, film_work_id, person_id, role, created',
+}
+
+
+def copy_rows(cursor, table: str, rows: Iterable[tuple]) -> int:
+    """Copy rows to the table in batches.
+
+    Args:
+        cursor: Cursor of the connection.
+        table: Name of the table in the content schema.
+        rows: Rows to copy.
+
+    Returns:
+        int: Count of copied rows.
+
+    """
+    count = 0
+    buffer = io.StringIO()
+    for count, row in enumerate(rows, 1):
+        buffer.write('\t'.join(row))
+        buffer.write('\n')
+        if count % COPY_BATCH == 0:
+            buffer.seek(0)
+            cursor.copy_expert('COPY content.{0} ({1}) FROM STDIN'.format(table, COLUMNS[table]), buffer)
+            buffer = io.StringIO()
+    buffer.seek(0)
+    cursor.copy_expert('COPY content.{0} ({1}) FROM STDIN'.format(table, COLUMNS[table]), buffer)
+    return count
+
+
+def fill(connection, films: int, persons: int, genres: int, seed: int = 0) -> dict:
+    """Replace the content with generated rows.
+
+    Triggers are disabled for the session while the rows are copied, so no
+    notifications or outbox rows are produced. The documents maintained by
+    the triggers are built afterwards in one pass.
+
+    Args:
+        connection: Postgres connection of a superuser.
+        films: Count of film works.
+        persons: Count of persons.
+        genres: Count of genres.
+        seed: Seed of the random generator.
+
+    Returns:
+        dict: Count of rows by the table name.
+
+    """
+    generator = Generator(seed)
+    genre_ids = [generator.uuid() for _ in range(genres)]
+    person_ids = [generator.uuid() for _ in range(persons)]
+    film_ids = [generator.uuid() for _ in range(films)]
+    rows = generator.rows(genre_ids, person_ids, film_ids)
+
+    counts = {}
+    with connection, connection.cursor() as cursor:
+        cursor.execute('SET LOCAL session_replication_role = replica')
+        cursor.execute('TRUNCATE {0}'.format(', '.join('content.{0}'.format(table) for table in TABLES)))
+        for table in reversed(TABLES):
+            counts[table] = copy_rows(cursor, table, rows[table])
+        cursor.execute("SELECT to_regproc('content.disable_movie_search_doc') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            # The copied rows skipped the triggers, the reader fills the documents when it enables them.
+            cursor.execute(DISABLE_SEARCH_DOC)
+    with connection.cursor() as cursor:
+        connection.autocommit = True
+        cursor.execute('VACUUM ANALYZE')
+    return counts
+
+
+def connect():
+    """Connect to the Postgres of the ETL settings.
+
+    Returns:
+        connection: Postgres connection.
+
+    """
+    pg_settings = settings.postgres.dict()
+    pg_settings.pop('connect_timeout')
+    return psycopg2.connect(**pg_settings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=100000)
+    parser.add_argument('--persons', type=int, default=50000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for table, count in fill(connect(), args.films, args.persons, args.genres, args.seed).items():
+        print('{0:>16}: {1:>10} rows'.format(table, count))
@@ -0,0 +1,260 @@
+"""Local HTTP stand-in for the Elasticsearch API used by the ETL.
+
+Indices, aliases and bulk actions are kept in memory. Documents are not
+indexed, only their ids and sizes are kept, so the stand-in is never the
+bottleneck of a benchmark.
+
+Usage:
+    python benchmarks/es_stub.py --port 9200
+
+Besides the ES API it serves:
+    GET /_benchmark/stats: counters of the received requests and actions.
+    POST /_benchmark/reset: reset the counters.
+
+"""
+
+import argparse
+import gzip
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from typing import Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+VERSION = '7.17.4'
+SOURCE_ACTIONS = frozenset(('index', 'create', 'update'))
+
+
+class Cluster(object):
+    """In-memory state of the stand-in.
+
+    Attributes:
+        indices: Documents sizes by id by the index name.
+        aliases: Index names by the alias name.
+        stats: Counters of the requests and actions.
+        lock: Lock of the state.
+
+    """
+
+    def __init__(self) -> None:
+        """Cluster class constructor."""
+        self.indices = {}
+        self.aliases = {}
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the counters."""
+        self.stats = {'bulk_requests': 0, 'actions': 0, 'bytes': 0, 'by_action': {}, 'updated_by_query': 0}
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Resolve an alias to the index name.
+
+        Args:
+            name: Name of an index or an alias.
+
+        Returns:
+            Optional[str]: Name of the index. None: there is no such index.
+
+        """
+        if name in self.indices:
+            return name
+        indices = self.aliases.get(name)
+        return next(iter(indices)) if indices else None
+
+    def bulk(self, body: bytes, default_index: Optional[str]) -> dict:
+        """Apply bulk actions.
+
+        Args:
+            body: NDJSON body of the bulk request.
+            default_index: Index of the request path.
+
+        Returns:
+            dict: Bulk response.
+
+        """
+        lines = iter(body.splitlines())
+        items = []
+        with self.lock:
+            self.stats['bulk_requests'] += 1
+            self.stats['bytes'] += len(body)
+            for line in lines:
+                if not line.strip():
+                    continue
+                (action, meta), = json.loads(line).items()
+                source = next(lines) if action in SOURCE_ACTIONS else b''
+                index = self.resolve(meta.get('_index') or default_index) or meta.get('_index') or default_index
+                documents = self.indices.setdefault(index, {})
+                if action == 'delete':
+                    status = 200 if documents.pop(meta['_id'], None) is not None else 404
+                else:
+                    status = 200 if meta['_id'] in documents else 201
+                    documents[meta['_id']] = len(source)
+                self.stats['actions'] += 1
+                self.stats['by_action'][action] = self.stats['by_action'].get(action, 0) + 1
+                items.append({action: {'_index': index, '_id': meta['_id'], 'status': status}})
+        return {'took': 1, 'errors': False, 'items': items}
+
+    def update_by_query(self, index: str, body: dict) -> dict:
+        """Count the documents matched by an ids query, the script is not run.
+
+        Args:
+            index: Name of an index or an alias.
+            body: Query and script of the request.
+
+        Returns:
+            dict: Update by query response.
+
+        """
+        with self.lock:
+            documents = self.indices.get(self.resolve(index), {})
+            updated = sum(doc_id in documents for doc_id in body['query']['ids']['values'])
+            self.stats['updated_by_query'] += updated
+        return {'took': 1, 'total': updated, 'updated': updated, 'version_conflicts': 0, 'failures': []}
+
+    def update_aliases(self, actions: list) -> None:
+        """Apply alias actions atomically.
+
+        Args:
+            actions: Alias actions of the request.
+
+        """
+        with self.lock:
+            for action in actions:
+                (name, params), = action.items()
+                if name == 'add':
+                    self.aliases.setdefault(params['alias'], set()).add(params['index'])
+                elif name == 'remove':
+                    self.aliases.get(params['alias'], set()).discard(params['index'])
+                elif name == 'remove_index':
+                    self.indices.pop(params['index'], None)
+                    for indices in self.aliases.values():
+                        indices.discard(params['index'])
+            self.aliases = {alias: indices for alias, indices in self.aliases.items() if indices}
+
+
+cluster = Cluster()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Route the ES API requests to the cluster."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args) -> None:
+        """Keep the output clean."""
+
+    def body(self) -> bytes:
+        """Read the request body.
+
+        Returns:
+            bytes: Decompressed body.
+
+        """
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return body
+
+    def reply(self, status: int = 200, payload: Optional[dict] = None) -> None:
+        """Send a JSON response.
+
+        Args:
+            status: HTTP status.
+            payload: Response body.
+
+        """
+        data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def route(self) -> Tuple[str, ...]:
+        """Split the request path.
+
+        Returns:
+            Tuple[str, ...]: Parts of the path.
+
+        """
+        return tuple(unquote(part) for part in urlparse(self.path).path.strip('/').split('/') if part)
+
+    def do_HEAD(self) -> None:  # noqa: N802
+        """Check that an index or an alias exists."""
+        parts = self.route()
+        if parts[:1] == ('_alias',):
+            self.reply(200 if parts[1] in cluster.aliases else 404)
+        else:
+            self.reply(200 if cluster.resolve(parts[0]) else 404)
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Serve the cluster info, aliases and the counters."""
+        parts = self.route()
+        if not parts:
+            self.reply(payload={
+                'version': {'number': VERSION, 'build_flavor': 'default'},
+                'tagline': 'You Know, for Search',
+            })
+        elif parts == ('_benchmark', 'stats'):
+            with cluster.lock:
+                self.reply(payload={
+                    **cluster.stats,
+                    'documents': {index: len(documents) for index, documents in cluster.indices.items()},
+                })
+        elif parts[:1] == ('_alias',) and parts[1] in cluster.aliases:
+            self.reply(payload={index: {'aliases': {parts[1]: {}}} for index in cluster.aliases[parts[1]]})
+        else:
+            self.reply(404, {'error': 'not found', 'status': 404})
+
+    def do_PUT(self) -> None:  # noqa: N802
+        """Create an index or update its settings."""
+        parts = self.route()
+        body = json.loads(self.body() or b'{}')
+        if len(parts) == 1:
+            with cluster.lock:
+                cluster.indices.setdefault(parts[0], {})
+                for alias in body.get('aliases', {}):
+                    cluster.aliases.setdefault(alias, set()).add(parts[0])
+            self.reply(payload={'acknowledged': True, 'index': parts[0]})
+        else:
+            self.reply(payload={'acknowledged': True})
+
+    def do_POST(self) -> None:  # noqa: N802
+        """Serve bulk, aliases and index maintenance requests."""
+        parts = self.route()
+        body = self.body()
+        if parts and parts[-1] == '_bulk':
+            self.reply(payload=cluster.bulk(body, parts[0] if len(parts) == 2 else None))
+        elif len(parts) == 2 and parts[1] == '_update_by_query':
+            self.reply(payload=cluster.update_by_query(parts[0], json.loads(body)))
+        elif parts == ('_aliases',):
+            cluster.update_aliases(json.loads(body)['actions'])
+            self.reply(payload={'acknowledged': True})
+        elif parts == ('_benchmark', 'reset'):
+            with cluster.lock:
+                cluster.reset()
+            self.reply(payload={'acknowledged': True})
+        else:
+            self.reply(payload={'acknowledged': True, '_shards': {'total': 1, 'successful': 1, 'failed': 0}})
+
+
+def serve(port: int) -> None:
+    """Serve the stand-in until interrupted.
+
+    Args:
+        port: Port to listen on.
+
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=9200)
+    args = parser.parse_args()
+    serve(args.port)
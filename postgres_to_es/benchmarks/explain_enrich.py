@@ -0,0 +1,128 @@
+"""Compare plans of the enrichment queries with EXPLAIN ANALYZE.
+
+Every query of ETL_ENRICH_QUERY runs on the same samples of film work ids
+of the content generated by datagen.py. Planning and execution time are
+medians of the repeated runs, the widest row count shows how many rows the
+joins materialize before the aggregation.
+
+Samples:
+    page: one flush page of film works in the id order.
+    actor: all the movies of the person with the most movies.
+    genre: all the movies of the genre with the most movies.
+
+Usage:
+    python benchmarks/explain_enrich.py --repeat 5
+    python benchmarks/explain_enrich.py --sample actor --plans
+
+"""
+
+import argparse
+import json
+import os
+import sys
+from statistics import median
+from typing import Iterator, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), 'etl'))
+for variable in ('DB_NAME', 'DB_USER', 'DB_PASSWORD', 'REDIS_PASSWORD'):
+    os.environ.setdefault(variable, 'benchmark')
+
+import datagen  # noqa: E402
+from config import settings  # noqa: E402
+from processors.enricher import ENRICH_QUERIES  # noqa: E402
+from processors.extractor import MIN_ID  # noqa: E402
+
+SAMPLES = {
+    'page': """
+        SELECT id::text FROM content.film_work ORDER BY id LIMIT %(page_size)s
+    """,
+    'actor': """
+        SELECT DISTINCT film_work_id::text FROM content.person_film_work
+        WHERE person_id = (
+            SELECT person_id FROM content.person_film_work WHERE role = 'actor'
+            GROUP BY person_id ORDER BY count(*) DESC LIMIT 1
+        )
+    """,
+    'genre': """
+        SELECT DISTINCT film_work_id::text FROM content.genre_film_work
+        WHERE genre_id = (
+            SELECT genre_id FROM content.genre_film_work GROUP BY genre_id ORDER BY count(*) DESC LIMIT 1
+        )
+    """,
+}
+
+
+def nodes(plan: dict) -> Iterator[dict]:
+    """Walk the plan tree.
+
+    Args:
+        plan: Node of the JSON plan.
+
+    Yields:
+        dict: The node and all its children.
+
+    """
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from nodes(child)
+
+
+def explain(cursor, query: str, film_ids: List[str], repeat: int) -> dict:
+    """Run EXPLAIN ANALYZE of the query several times.
+
+    Args:
+        cursor: Cursor of the benchmark connection.
+        query: Enrichment query.
+        film_ids: Film work ids of the sample.
+        repeat: Count of the runs.
+
+    Returns:
+        dict: Median times, buffers and the widest row count of the last run, the last plan.
+
+    """
+    planning, execution = [], []
+    for _ in range(repeat):
+        cursor.execute(
+            'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + query,
+            {'film_ids': film_ids, 'last_id': MIN_ID},
+        )
+        result, = cursor.fetchone()[0]
+        planning.append(result['Planning Time'])
+        execution.append(result['Execution Time'])
+    plan = result['Plan']
+    return {
+        'planning': median(planning),
+        'execution': median(execution),
+        'buffers': plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0),
+        'widest': max(node['Actual Rows'] * node['Actual Loops'] for node in nodes(plan)),
+        'rows': plan['Actual Rows'],
+        'plan': result,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sample', choices=sorted(SAMPLES), action='append', help='samples to run, all by default')
+    parser.add_argument('--page-size', type=int, default=settings.page_size)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--plans', action='store_true', help='print the JSON plans')
+    args = parser.parse_args()
+
+    connection = datagen.connect()
+    with connection, connection.cursor() as cursor:
+        print('{0:>8} {1:>8} {2:>7} {3:>13} {4:>14} {5:>10} {6:>10}'.format(
+            'sample', 'query', 'movies', 'planning, ms', 'execution, ms', 'buffers', 'widest',
+        ))
+        for sample in args.sample or SAMPLES:
+            cursor.execute(SAMPLES[sample], {'page_size': args.page_size})
+            film_ids = sorted(record[0] for record in cursor.fetchall())
+            for name, query in ENRICH_QUERIES.items():
+                stats = explain(cursor, query, film_ids, args.repeat)
+                print('{0:>8} {1:>8} {2:>7} {3:>13.2f} {4:>14.2f} {5:>10} {6:>10}'.format(
+                    sample, name, stats['rows'], stats['planning'], stats['execution'],
+                    stats['buffers'], stats['widest'],
+                ))
+                if args.plans:
+                    print(json.dumps(stats['plan'], indent=2))
+    connection.close()
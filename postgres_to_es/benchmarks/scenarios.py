@@ -0,0 +1,418 @@
+"""Benchmark of the ETL chain on synthetic data.
+
+Postgres connection is taken from the ETL settings (DB_* variables), the
+content is generated by datagen.py. Elasticsearch is replaced by the local
+stand-in of es_stub.py, so the numbers show the cost of the ETL itself.
+
+Scenarios:
+    full_load: load all the movies from empty watermarks.
+    film_edit: edit the title of one movie.
+    actor_edit: rename the person with the most movies.
+    genre_rename: rename the genre with the most movies.
+    cast_delete: remove one actor from the cast of a movie.
+    film_delete: delete one movie with its cast and genres.
+
+Every scenario reports documents per second and peak RSS for each stage.
+
+Usage:
+    python benchmarks/scenarios.py --films 100000 --persons 50000 --genres 30
+    python benchmarks/scenarios.py --skip-generate --memory-state
+    python benchmarks/scenarios.py --skip-generate --rename-in-place
+    python benchmarks/scenarios.py --skip-generate --search-doc
+
+"""
+
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+from functools import wraps
+from time import perf_counter, sleep
+from typing import Callable, Iterable, List, Optional
+from urllib.request import Request, urlopen
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), 'etl'))
+for variable in ('DB_NAME', 'DB_USER', 'DB_PASSWORD', 'REDIS_PASSWORD'):
+    os.environ.setdefault(variable, 'benchmark')
+
+import datagen  # noqa: E402
+from config import settings  # noqa: E402
+from database.pg_database import PGConnection  # noqa: E402
+from lib import storage  # noqa: E402
+from processors.enricher import NAMES, Enricher  # noqa: E402
+from processors.extractor import Extractor  # noqa: E402
+from processors.loader import ESLoader  # noqa: E402
+from processors.search_doc import SearchDocReader  # noqa: E402
+from processors.transformer import Transformer  # noqa: E402
+
+STATE_NAME = 'benchmark'
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+SCENARIOS = {
+    'film_edit': """
+        UPDATE content.film_work SET title = title || ' (edited)', modified = now()
+        WHERE id = (SELECT id FROM content.film_work ORDER BY id LIMIT 1)
+    """,
+    'actor_edit': """
+        UPDATE content.person SET full_name = full_name || ' Jr.', modified = now()
+        WHERE id = (
+            SELECT person_id FROM content.person_film_work WHERE role = 'actor'
+            GROUP BY person_id ORDER BY count(*) DESC LIMIT 1
+        )
+    """,
+    'genre_rename': """
+        UPDATE content.genre SET name = name || ' (renamed)', modified = now()
+        WHERE id = (
+            SELECT genre_id FROM content.genre_film_work GROUP BY genre_id ORDER BY count(*) DESC LIMIT 1
+        )
+    """,
+    'cast_delete': """
+        DELETE FROM content.person_film_work
+        WHERE id = (SELECT id FROM content.person_film_work WHERE role = 'actor' ORDER BY id LIMIT 1)
+    """,
+    'film_delete': """
+        WITH film AS (SELECT id FROM content.film_work ORDER BY id DESC LIMIT 1),
+        persons AS (DELETE FROM content.person_film_work WHERE film_work_id IN (SELECT id FROM film)),
+        genres AS (DELETE FROM content.genre_film_work WHERE film_work_id IN (SELECT id FROM film))
+        DELETE FROM content.film_work WHERE id IN (SELECT id FROM film)
+    """,
+}
+
+
+class MemoryStorage(storage.BaseStorage):
+    """Keep the state in the process, to benchmark without Redis."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        """MemoryStorage class constructor."""
+        self.data = {}
+        self.sets = {}
+
+    def save_state(self, state: dict, cleared: Iterable[str] = ()) -> None:
+        """Save state to memory."""
+        self.data.update(state)
+        for key in cleared:
+            self.sets.pop(key, None)
+
+    def retrieve_state(self) -> dict:
+        """Get state from memory."""
+        return dict(self.data)
+
+    def add_members(self, key: str, members: Iterable[str]) -> None:
+        """Add members to the set in memory."""
+        self.sets.setdefault(key, set()).update(members)
+
+    def members(self, key: str) -> List[str]:
+        """Get sorted members of the set in memory."""
+        return sorted(self.sets.get(key, ()))
+
+
+def rss() -> int:
+    """Get the current resident set size of the process.
+
+    Returns:
+        int: RSS in bytes.
+
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageMeter(object):
+    """Measure exclusive time, item count and peak RSS of the wrapped stages.
+
+    Stages call each other through result handlers, the time of a nested stage
+    is subtracted from the time of the calling one.
+
+    Attributes:
+        stats: Measurements by the stage name.
+        stack: Time of the nested stages of every running stage.
+
+    """
+
+    def __init__(self) -> None:
+        """StageMeter class constructor."""
+        self.stats = {}
+        self.stack = []
+
+    def wrap(self, stage: str, func: Callable, items: Callable) -> Callable:
+        """Measure calls of the function.
+
+        Args:
+            stage: Name of the stage.
+            func: Function to measure.
+            items: Count processed items by the args, kwargs and result of the call.
+
+        Returns:
+            Callable: Wrapped function.
+
+        """
+        @wraps(func)
+        def inner(*args, **kwargs):
+            started = perf_counter()
+            self.stack.append(0)
+            result = None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            finally:
+                elapsed = perf_counter() - started
+                nested = self.stack.pop()
+                if self.stack:
+                    self.stack[-1] += elapsed
+                stat = self.stats.setdefault(stage, {'calls': 0, 'items': 0, 'seconds': 0, 'rss': 0})
+                stat['calls'] += 1
+                stat['items'] += items(args, kwargs, result)
+                stat['seconds'] += elapsed - nested
+                stat['rss'] = max(stat['rss'], rss())
+        return inner
+
+
+def es_request(method: str, path: str) -> dict:
+    """Call the stand-in API.
+
+    Args:
+        method: HTTP method.
+        path: Path of the request.
+
+    Returns:
+        dict: Response body.
+
+    """
+    with urlopen(Request(settings.es.connection.hosts.rstrip('/') + path, method=method)) as response:
+        return json.loads(response.read())
+
+
+def start_es_stub() -> subprocess.Popen:
+    """Start the stand-in on a free port and point the ETL settings to it.
+
+    Returns:
+        subprocess.Popen: Process of the stand-in.
+
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, os.path.join(BENCHMARKS_DIR, 'es_stub.py'), '--port', str(port)])
+    settings.es.connection.hosts = 'http://127.0.0.1:{0}'.format(port)
+    for _ in range(100):
+        try:
+            es_request('GET', '/')
+            return process
+        except OSError:
+            sleep(0.1)
+    process.kill()
+    raise RuntimeError('The ES stand-in has not started')
+
+
+class Chain(object):
+    """ETL chain with measured stages.
+
+    Attributes:
+        meter: Measurements of the stages.
+        extractor: Extractor of the chain.
+        entities: Tables to extract, created by the applied migrations.
+        enricher: Enricher of the chain.
+        reader: Reader of the documents maintained by the database. None: the documents are enriched.
+
+    """
+
+    def __init__(
+        self,
+        pg: PGConnection,
+        extract_pg: PGConnection,
+        memory_state: bool,
+        rename_in_place: bool,
+        search_doc: bool,
+    ) -> None:
+        """Chain class constructor.
+
+        Args:
+            pg: Connection of the Enricher.
+            extract_pg: Dedicated connection of the Extractor to measure its queries,
+                writable for the search document reader.
+            memory_state: Keep the state in memory instead of Redis.
+            rename_in_place: Replace renamed persons and genres in the index in place.
+            search_doc: Read the documents maintained by the database triggers.
+
+        """
+        self.meter = StageMeter()
+        loader = ESLoader(
+            redis_settings=settings.cache.loader,
+            transport_options=settings.es.connection.dict(),
+            bulk_options=settings.es.bulk.dict(),
+            index=settings.es.index,
+            index_schema=settings.es.index_schema,
+            state_name=STATE_NAME,
+            version=settings.es.version,
+            hash_cache_size=0 if memory_state else settings.es.hash_cache_size,
+        )
+        transformer = Transformer(
+            result_handler=self.meter.wrap('load', loader.proccess, lambda args, kwargs, result: len(args[0])),
+            validate_rate=settings.validate_rate,
+        )
+        self.enricher = Enricher(
+            pg=pg,
+            redis_settings=settings.cache.enricher,
+            result_handler=self.meter.wrap(
+                'transform', transformer.proccess, lambda args, kwargs, result: len(args[0]),
+            ),
+            page_size=settings.page_size,
+            state_name=STATE_NAME,
+            renamer=self.meter.wrap(
+                'rename', loader.rename, lambda args, kwargs, result: len(args[1]),
+            ) if rename_in_place else None,
+            query=settings.enrich_query,
+        )
+        self.enricher.next_chunk = self.meter.wrap(
+            'enrich', self.enricher.next_chunk, lambda args, kwargs, result: len(result or ()),
+        )
+        extract_pg.retry_fetchall = self.meter.wrap(
+            'extract', extract_pg.retry_fetchall, lambda args, kwargs, result: len(result or ()),
+        )
+        self.extractor = Extractor(
+            pg=extract_pg,
+            redis_settings=settings.cache.extractor,
+            result_handler=self.meter.wrap(
+                'resolve', self.enricher.proccess, lambda args, kwargs, result: len(kwargs['pkeys']),
+            ),
+            state_name=STATE_NAME,
+        )
+        self.entities = self.extractor.existing(settings.entities)
+        self.reader = None
+        if search_doc:
+            self.reader = SearchDocReader(
+                pg=extract_pg,
+                redis_settings=settings.cache.extractor,
+                result_handler=self.meter.wrap(
+                    'load', loader.proccess_raw, lambda args, kwargs, result: len(args[0]),
+                ),
+                state_name=STATE_NAME,
+            )
+
+    def cycle(self) -> None:
+        """Extract all the changes and flush the collected movies."""
+        if self.reader:
+            while self.reader.proccess(page_size=settings.page_size):
+                pass
+            return
+        for entity in self.entities:
+            while self.extractor.proccess(entity, page_size=settings.page_size):
+                pass
+        self.enricher.flush()
+
+
+def clear_state() -> None:
+    """Remove the benchmark state from Redis."""
+    for redis_settings in (settings.cache.extractor, settings.cache.enricher, settings.cache.loader):
+        redis_storage = storage.RedisStorage(redis_settings, name=STATE_NAME)
+        redis_storage.try_command(redis_storage.redis_adapter.delete, STATE_NAME, redis_storage.set_name('film_ids'))
+    redis_storage = storage.RedisStorage(settings.cache.loader)
+    redis_storage.try_command(redis_storage.redis_adapter.delete, 'hashes:{0}'.format(settings.es.index))
+    redis_storage = storage.RedisStorage(settings.cache.enricher)
+    redis_storage.try_command(
+        redis_storage.redis_adapter.delete,
+        *('{0}:names:{1}'.format(STATE_NAME, table) for table in NAMES),
+    )
+
+
+def report(scenario: str, chain: Chain, written: float, elapsed: float, stats: dict) -> None:
+    """Print the measurements of the scenario.
+
+    Args:
+        scenario: Name of the scenario.
+        chain: Measured chain.
+        written: Time of the change statement, with the database triggers.
+        elapsed: Wall time of the scenario.
+        stats: Counters of the ES stand-in.
+
+    """
+    actions = stats['actions'] + stats['updated_by_query']
+    print('\n{0}: write {1:.2f} s, ETL {2:.2f} s, {3} bulk actions, {4} updated by query, {5:.0f} docs/sec'.format(
+        scenario, written, elapsed, stats['actions'], stats['updated_by_query'], actions / elapsed if elapsed else 0,
+    ))
+    print('{0:>10} {1:>8} {2:>10} {3:>10} {4:>12} {5:>14}'.format(
+        'stage', 'calls', 'items', 'seconds', 'items/sec', 'peak RSS, MB',
+    ))
+    for stage in ('extract', 'resolve', 'rename', 'enrich', 'transform', 'load'):
+        stat = chain.meter.stats.get(stage)
+        if not stat:
+            continue
+        print('{0:>10} {1:>8} {2:>10} {3:>10.3f} {4:>12.0f} {5:>14.1f}'.format(
+            stage,
+            stat['calls'],
+            stat['items'],
+            stat['seconds'],
+            stat['items'] / stat['seconds'] if stat['seconds'] else 0,
+            stat['rss'] / 1024 / 1024,
+        ))
+
+
+def run(scenario: str, chain: Chain, sql: Optional[str]) -> None:
+    """Run one scenario and report it.
+
+    Args:
+        scenario: Name of the scenario.
+        chain: Chain to run.
+        sql: Statement to change the content before the cycle. None: load everything.
+
+    """
+    started = perf_counter()
+    if sql:
+        connection = datagen.connect()
+        with connection, connection.cursor() as cursor:
+            cursor.execute(sql)
+        connection.close()
+    written = perf_counter() - started
+    es_request('POST', '/_benchmark/reset')
+    chain.meter.stats.clear()
+    started = perf_counter()
+    chain.cycle()
+    elapsed = perf_counter() - started
+    report(scenario, chain, written, elapsed, es_request('GET', '/_benchmark/stats'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=100000)
+    parser.add_argument('--persons', type=int, default=50000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-generate', action='store_true', help='use the content already in Postgres')
+    parser.add_argument('--memory-state', action='store_true', help='keep the ETL state in memory instead of Redis')
+    parser.add_argument(
+        '--search-doc', action='store_true', help='read the documents maintained by the database triggers',
+    )
+    parser.add_argument(
+        '--rename-in-place', action='store_true', help='replace renamed persons and genres in the index in place',
+    )
+    args = parser.parse_args()
+
+    if not args.skip_generate:
+        print(datagen.fill(datagen.connect(), args.films, args.persons, args.genres, args.seed))
+
+    if args.memory_state:
+        storage.RedisStorage = MemoryStorage
+    else:
+        clear_state()
+
+    es_stub = start_es_stub()
+    try:
+        chain = Chain(
+            PGConnection(settings.postgres.dict()),
+            PGConnection(settings.postgres.dict(), readonly=not args.search_doc),
+            args.memory_state,
+            args.rename_in_place,
+            args.search_doc,
+        )
+        run('full_load', chain, None)
+        for name, statement in SCENARIOS.items():
+            run(name, chain, statement)
+    finally:
+        es_stub.terminate()
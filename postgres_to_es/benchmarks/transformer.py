@@ -0,0 +1,80 @@
+"""Benchmark of the Transformer fast and validated paths.
+
+Usage:
+    python benchmarks/transformer.py --movies 10000 --persons 30
+
+"""
+
+import argparse
+import copy
+import os
+import random
+import sys
+import uuid
+from decimal import Decimal
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'etl'))
+for variable in ('DB_NAME', 'DB_USER', 'DB_PASSWORD', 'REDIS_PASSWORD'):
+    os.environ.setdefault(variable, 'benchmark')
+
+from processors.transformer import Transformer  # noqa: E402
+
+ROLES = ('actor', 'actor', 'actor', 'writer', 'director')
+
+
+def generate_movies(count: int, persons: int) -> list:
+    """Generate movies in the Enricher query result format.
+
+    Args:
+        count: Count of movies.
+        persons: Count of persons per movie.
+
+    Returns:
+        list: Generated movies.
+
+    """
+    return [
+        {
+            'id': str(uuid.uuid4()),
+            'imdb_rating': Decimal('7.5'),
+            'title': 'Movie {0}'.format(idx),
+            'description': 'Description of the movie {0}'.format(idx),
+            'modified': None,
+            'persons': [
+                {'role': random.choice(ROLES), 'id': str(uuid.uuid4()), 'name': 'Person {0}'.format(person)}
+                for person in range(persons)
+            ],
+            'genre': ['Action', 'Drama'],
+        }
+        for idx in range(count)
+    ]
+
+
+def measure(movies: list, validate_rate: float) -> float:
+    """Transform the movies and measure throughput.
+
+    Args:
+        movies: Movies to transform.
+        validate_rate: Share of documents to validate.
+
+    Returns:
+        float: Documents per second.
+
+    """
+    transformer = Transformer(result_handler=lambda documents, **kwargs: None, validate_rate=validate_rate)
+    started = perf_counter()
+    transformer.proccess(movies)
+    return len(movies) / (perf_counter() - started)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movies', type=int, default=10000)
+    parser.add_argument('--persons', type=int, default=30)
+    args = parser.parse_args()
+
+    movies = generate_movies(args.movies, args.persons)
+    for name, validate_rate in (('fast', 0), ('validated', 1)):
+        docs_per_sec = measure(copy.deepcopy(movies), validate_rate)
+        print('{0:>10}: {1:>10.0f} docs/sec'.format(name, docs_per_sec))
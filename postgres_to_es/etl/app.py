@@ -1,53 +1,275 @@
 """Movies ETL Service."""
 
+import argparse
 import logging
+import signal
+from functools import partial
 from logging.config import dictConfig
 from time import sleep
 
 from config import settings
+from lib.adaptive import AIMDSize
 from lib.loggers import LOGGING
+from lib.metrics import ENTITY_LAG
+from lib.profiling import Profiler
+from database.backoff_connection import skip_when_open
 from database.pg_database import PGConnection
+from processors.coalescer import Coalescer
 from processors.enricher import Enricher
 from processors.extractor import Extractor
-from processors.loader import ESLoader
+from processors.listener import Listener
+from processors.loader import ESLoader, versioned_index
+from processors.outbox import OutboxConsumer
+from processors.pipeline import Pipeline
+from processors.reindexer import FullReindexer
+from processors.search_doc import SEARCH_DOC_TABLE, SearchDocReader
+from processors.tombstones import TOMBSTONE_TABLE, TombstonePruner
 from processors.transformer import Transformer
+from prometheus_client import start_http_server
 
 dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
 
 pg = PGConnection(settings.postgres.dict())
 
+REINDEX_STATE = 'reindex'
+
+
+def full_reindex() -> None:
+    """Build the index of the configured version and swap the alias to it.
+
+    The chain has its own state, so the reindex runs beside the incremental process.
+    """
+    loader = ESLoader(
+        redis_settings=settings.cache.loader,
+        transport_options=settings.es.connection.dict(),
+        bulk_options=settings.es.bulk.dict(),
+        index=versioned_index(settings.es.index, settings.es.version),
+        index_schema=settings.es.index_schema,
+        state_name=REINDEX_STATE,
+    )
+    transformer = Transformer(result_handler=loader.proccess, validate_rate=settings.validate_rate)
+    enricher = Enricher(
+        pg=pg,
+        redis_settings=settings.cache.enricher,
+        result_handler=transformer.proccess,
+        page_size=settings.page_size,
+        state_name=REINDEX_STATE,
+        query=settings.enrich_query,
+    )
+    extractor = Extractor(
+        pg=pg,
+        redis_settings=settings.cache.extractor,
+        result_handler=enricher.proccess,
+        state_name=REINDEX_STATE,
+    )
+    FullReindexer(
+        pg=pg,
+        extractor=extractor,
+        enricher=enricher,
+        loader=loader,
+        entities=extractor.existing(settings.entities),
+        page_size=settings.page_size,
+        alias=settings.es.index,
+    ).proccess()
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--full-reindex',
+        action='store_true',
+        help='build the index of ES_INDEX_VERSION, swap the alias to it and exit',
+    )
+    args = parser.parse_args()
+
+    if settings.metrics.enabled:
+        start_http_server(settings.metrics.port)
+
+    if args.full_reindex:
+        logger.info('Full reindex')
+        full_reindex()
+        raise SystemExit()
 
     logger.info('Initializing')
 
+    profiler = Profiler(
+        cycles=settings.profile.cycles,
+        directory=settings.profile.directory,
+        requested=settings.profile.on_start,
+    )
+    signal.signal(signal.SIGUSR1, profiler.request)
+
+    pipeline = Pipeline(enabled=settings.pipeline, depth=settings.queue_depth)
+
+    page_sizer, chunk_sizer = None, None
+    if settings.adaptive.enabled:
+        page_sizer = AIMDSize(
+            name='page size',
+            initial=settings.page_size,
+            minimum=settings.adaptive.page_size_min,
+            maximum=settings.adaptive.page_size_max,
+            step=settings.adaptive.page_size_step,
+            factor=settings.adaptive.factor,
+            target_latency=settings.adaptive.page_latency,
+        )
+        chunk_sizer = AIMDSize(
+            name='bulk chunk size',
+            initial=settings.es.bulk.chunk_size,
+            minimum=settings.adaptive.chunk_size_min,
+            maximum=settings.adaptive.chunk_size_max,
+            step=settings.adaptive.chunk_size_step,
+            factor=settings.adaptive.factor,
+            target_latency=settings.adaptive.chunk_latency,
+        )
+
     loader = ESLoader(
         redis_settings=settings.cache.loader,
         transport_options=settings.es.connection.dict(),
+        bulk_options=settings.es.bulk.dict(),
         index=settings.es.index,
         index_schema=settings.es.index_schema,
+        state_name=settings.state_name,
+        version=settings.es.version,
+        hash_cache_size=settings.es.hash_cache_size,
+        chunk_sizer=chunk_sizer,
     )
+    profiler.instrument(loader, 'bulk', 'loader.bulk')
     transformer = Transformer(
-        redis_settings=settings.cache.transformer,
-        result_handler=loader.proccess,
+        result_handler=pipeline.stage(loader.proccess),
+        validate_rate=settings.validate_rate,
     )
+    profiler.instrument(transformer, 'proccess', 'transformer.proccess')
+
+    def rename_in_place(*args) -> bool:
+        """Replace a name in the index after the queued movies with the old name are loaded."""
+        pipeline.drain()
+        return loader.rename(*args)
 
     enricher = Enricher(
         pg=pg,
         redis_settings=settings.cache.enricher,
-        result_handler=transformer.proccess,
+        result_handler=pipeline.stage(transformer.proccess),
         page_size=settings.page_size,
+        shard_index=settings.shard_index,
+        shard_count=settings.shard_count,
+        state_name=settings.state_name,
+        renamer=rename_in_place if settings.rename_in_place else None,
+        query=settings.enrich_query,
+    )
+    profiler.instrument(enricher, 'proccess', 'enricher.proccess')
+    profiler.instrument(enricher, 'flush', 'enricher.flush')
+
+    coalescer = Coalescer(
+        redis_settings=settings.cache.coalescer,
+        result_handler=enricher.proccess,
+        window=settings.coalesce.window,
+        max_size=settings.coalesce.max_size,
+        state_name=settings.state_name,
     )
 
     extractor = Extractor(
         pg=pg,
         redis_settings=settings.cache.extractor,
-        result_handler=enricher.proccess,
+        result_handler=coalescer.proccess,
+        shard_index=settings.shard_index,
+        shard_count=settings.shard_count,
+        state_name=settings.state_name,
+        page_sizer=page_sizer,
     )
+    profiler.instrument(extractor, 'proccess', 'extractor.proccess')
+    entities = extractor.existing(settings.entities)
+
+    pruner = None
+    if TOMBSTONE_TABLE in entities:
+        pruner = TombstonePruner(
+            pg=PGConnection(settings.postgres.dict(), readonly=False),
+            redis_settings=settings.cache.extractor,
+            state_names=settings.state_names + [REINDEX_STATE],
+            retention=settings.tombstones.retention,
+            interval=settings.tombstones.prune_interval,
+        )
 
     logger.info('Started')
+    if settings.search_doc:
+        reader = SearchDocReader(
+            pg=PGConnection(settings.postgres.dict(), readonly=False),
+            redis_settings=settings.cache.extractor,
+            result_handler=pipeline.stage(loader.proccess_raw),
+            shard_index=settings.shard_index,
+            shard_count=settings.shard_count,
+            state_name=settings.state_name,
+            page_sizer=page_sizer,
+        )
+        profiler.instrument(reader, 'proccess', 'search_doc.proccess')
+        ENTITY_LAG.labels(SEARCH_DOC_TABLE).set_function(partial(reader.lag, SEARCH_DOC_TABLE))
+        while True:
+            with skip_when_open(settings.delay):
+                if not reader.proccess(page_size=settings.page_size):
+                    pipeline.drain()
+                    profiler.cycle()
+                    if pruner:
+                        pruner.proccess()
+                    sleep(settings.delay)
+
+    if settings.outbox:
+        consumer = OutboxConsumer(
+            pg=PGConnection(settings.postgres.dict(), readonly=False, autocommit=False),
+            enricher=enricher,
+            drain=pipeline.drain,
+            page_size=settings.page_size,
+        )
+        while True:
+            with skip_when_open(settings.delay):
+                if not consumer.proccess():
+                    sleep(settings.delay)
+                profiler.cycle()
+                if pruner:
+                    pruner.proccess()
+
+    # The Extractor runs only in the listen and polling modes.
+    for entity in entities:
+        ENTITY_LAG.labels(entity).set_function(partial(extractor.lag, entity))
+
+    if settings.listen.enabled:
+        listener = Listener(
+            pg=PGConnection(settings.postgres.dict()),
+            channel=settings.listen.channel,
+            entities=entities,
+            window=settings.listen.window,
+            max_size=settings.listen.max_size,
+            timeout=settings.listen.timeout,
+        )
+        tables = set()
+        while True:
+            with skip_when_open(settings.delay):
+                # Tables of a skipped cycle are scanned again before waiting.
+                if not tables:
+                    tables = listener.wait(timeout=coalescer.remaining())
+                while tables:
+                    unfinished = set()
+                    for table in tables:
+                        if extractor.proccess(table, page_size=settings.page_size):
+                            unfinished.add(table)
+                    coalescer.tick()
+                    pipeline.drain()
+                    enricher.flush()
+                    tables = unfinished
+                coalescer.tick()
+                pipeline.drain()
+                profiler.cycle()
+                enricher.flush()
+                if pruner:
+                    pruner.proccess()
+
     while True:
-        for entity in settings.entities:
-            extractor.proccess(entity, page_size=settings.page_size)
-            sleep(settings.delay)
+        with skip_when_open(settings.delay):
+            for entity in entities:
+                extractor.proccess(entity, page_size=settings.page_size)
+                sleep(settings.delay)
+            coalescer.tick()
+            pipeline.drain()
+            profiler.cycle()
+            enricher.flush()
+            if pruner:
+                pruner.proccess()
@@ -1,5 +1,5 @@
 """Project settings."""
-from typing import Set
+from typing import List, Set
 from pydantic import BaseSettings, Field
 from lib import es_index_schema
 
@@ -17,13 +17,28 @@ class PostgresSettings(BaseSettings):
 class ElasticsearchConnection(BaseSettings):
     """Elasticsearch connection settings."""
     hosts: str = Field('http://localhost:9200', env='ES_HOST')
+    http_compress: bool = Field(False, env='ES_HTTP_COMPRESS')
+
+
+class ElasticsearchBulk(BaseSettings):
+    """Elasticsearch bulk settings."""
+    mode: str = Field('streaming', env='ES_BULK_MODE')
+    thread_count: int = Field(4, env='ES_BULK_THREADS')
+    chunk_size: int = 500
+    max_chunk_bytes: int = Field(10 * 1024 * 1024, env='ES_BULK_MAX_BYTES')
+    max_retries: int = 5
+    initial_backoff: float = 1
+    max_backoff: float = 60
 
 
 class ElasticsearchSettings(BaseSettings):
     """Elasticsearch index settings."""
     connection: ElasticsearchConnection = ElasticsearchConnection()
+    bulk: ElasticsearchBulk = ElasticsearchBulk()
     index: str = 'movies'
     index_schema: dict = es_index_schema.movies
+    version: int = Field(1, env='ES_INDEX_VERSION')
+    hash_cache_size: int = Field(100000, env='ES_HASH_CACHE_SIZE')
 
 
 class RedisSettings(BaseSettings):
@@ -33,11 +48,59 @@ class RedisSettings(BaseSettings):
     password: str = Field(env='REDIS_PASSWORD')
 
 
+class AdaptiveSettings(BaseSettings):
+    """Bounds of the adaptive page and bulk chunk sizes."""
+    enabled: bool = Field(False, env='ETL_ADAPTIVE')
+    factor: float = 0.5
+    page_size_min: int = Field(100, env='ETL_PAGE_SIZE_MIN')
+    page_size_max: int = Field(5000, env='ETL_PAGE_SIZE_MAX')
+    page_size_step: int = 100
+    page_latency: float = Field(1, env='ETL_PAGE_LATENCY')
+    chunk_size_min: int = Field(50, env='ES_CHUNK_SIZE_MIN')
+    chunk_size_max: int = Field(5000, env='ES_CHUNK_SIZE_MAX')
+    chunk_size_step: int = 50
+    chunk_latency: float = Field(2, env='ES_CHUNK_LATENCY')
+
+
+class ListenSettings(BaseSettings):
+    """Postgres notifications settings."""
+    enabled: bool = Field(False, env='ETL_LISTEN')
+    channel: str = 'content_changes'
+    window: float = Field(0.5, env='ETL_LISTEN_WINDOW')
+    max_size: int = 1000
+    timeout: float = 60
+
+
+class CoalesceSettings(BaseSettings):
+    """Changed records coalescing settings."""
+    window: float = Field(0, env='ETL_COALESCE_WINDOW')
+    max_size: int = Field(10000, env='ETL_COALESCE_SIZE')
+
+
+class MetricsSettings(BaseSettings):
+    """Prometheus metrics endpoint settings."""
+    enabled: bool = Field(False, env='ETL_METRICS')
+    port: int = Field(8000, env='ETL_METRICS_PORT')
+
+
+class ProfileSettings(BaseSettings):
+    """On-demand profiling settings, profiling is requested on start or by SIGUSR1."""
+    on_start: bool = Field(False, env='ETL_PROFILE')
+    cycles: int = Field(3, env='ETL_PROFILE_CYCLES')
+    directory: str = Field('/tmp', env='ETL_PROFILE_DIR')
+
+
+class TombstoneSettings(BaseSettings):
+    """Retention of the tombstones of deleted records, the tombstone table is created by migration 0005."""
+    retention: int = Field(7 * 24 * 3600, env='ETL_TOMBSTONE_RETENTION')
+    prune_interval: int = Field(600, env='ETL_TOMBSTONE_PRUNE_INTERVAL')
+
+
 class Cashe(BaseSettings):
     """Redis connection settings for every processor."""
     extractor: dict = {**RedisSettings().dict(), 'db': 1}
     enricher: dict = {**RedisSettings().dict(), 'db': 2}
-    transformer: dict = {**RedisSettings().dict(), 'db': 3}
+    coalescer: dict = {**RedisSettings().dict(), 'db': 5}
     loader: dict = {**RedisSettings().dict(), 'db': 4}
 
 
@@ -47,10 +110,49 @@ class Settings(BaseSettings):
     postgres: PostgresSettings = PostgresSettings()
     es: ElasticsearchSettings = ElasticsearchSettings()
     cache: Cashe = Cashe()
+    listen: ListenSettings = ListenSettings()
+    coalesce: CoalesceSettings = CoalesceSettings()
+    adaptive: AdaptiveSettings = AdaptiveSettings()
+    metrics: MetricsSettings = MetricsSettings()
+    profile: ProfileSettings = ProfileSettings()
+    tombstones: TombstoneSettings = TombstoneSettings()
     delay: int = 1
     page_size: int = 1000
-    entities: Set[str] = ('film_work', 'person', 'genre')
+    entities: Set[str] = ('film_work', 'person', 'genre', 'tombstone')
     debug: str = Field('INFO', env='DEBUG')
+    pipeline: bool = Field(False, env='ETL_PIPELINE')
+    outbox: bool = Field(False, env='ETL_OUTBOX')
+    rename_in_place: bool = Field(False, env='ETL_RENAME_IN_PLACE')
+    enrich_query: str = Field('join', env='ETL_ENRICH_QUERY')
+    search_doc: bool = Field(False, env='ETL_SEARCH_DOC')
+    queue_depth: int = Field(2, env='ETL_QUEUE_DEPTH')
+    validate_rate: float = Field(0, env='ETL_VALIDATE_RATE')
+    shard_index: int = Field(0, env='ETL_SHARD_INDEX')
+    shard_count: int = Field(1, env='ETL_SHARD_COUNT')
+
+    def shard_state_name(self, shard_index: int) -> str:
+        """Name of the processors state of the shard.
+
+        Args:
+            shard_index: Index of the shard.
+
+        Returns:
+            str: Name of the state.
+
+        """
+        if self.shard_count > 1:
+            return 'state:{0}/{1}'.format(shard_index, self.shard_count)
+        return 'state'
+
+    @property
+    def state_name(self) -> str:
+        """Name of the processors state, every shard keeps its own state."""
+        return self.shard_state_name(self.shard_index)
+
+    @property
+    def state_names(self) -> List[str]:
+        """Names of the processors states of all the shards."""
+        return [self.shard_state_name(shard_index) for shard_index in range(self.shard_count)]
 
 
 settings = Settings()
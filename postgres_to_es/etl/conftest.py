@@ -0,0 +1,8 @@
+"""Make the ETL modules importable by the tests, set the settings required to import them."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+for variable in ('DB_NAME', 'DB_USER', 'DB_PASSWORD', 'REDIS_PASSWORD'):
+    os.environ.setdefault(variable, 'test')
@@ -2,12 +2,136 @@
 """Backoff decorators."""
 
 import logging
+from contextlib import contextmanager
 from functools import wraps
-from time import sleep
-from typing import Any, Tuple
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+from lib.metrics import BACKOFF_RETRIES, CIRCUIT_STATE
 
 logger = logging.getLogger(__name__)
 
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Max time in seconds to retry a call of the processing loop. Calls with the deadline
+# are safe to fail: the loop skips the cycle and repeats it from the saved state.
+DEADLINES = {'postgres': 60, 'redis': 30, 'elasticsearch': 60}
+
+
+class CircuitOpenError(Exception):
+    """The dependency is unavailable and the call deadline is over.
+
+    Attributes:
+        dependency: Name of the dependency.
+
+    """
+
+    def __init__(self, dependency: Optional[str]) -> None:
+        """CircuitOpenError class constructor.
+
+        Args:
+            dependency: Name of the dependency.
+
+        """
+        super().__init__(dependency)
+        self.dependency = dependency
+
+
+class CircuitBreaker(object):
+    """Stop calling a dependency after consecutive failures.
+
+    While the breaker is open calls are not made. After reset_timeout one call
+    is let through as a probe: its success closes the breaker, its failure
+    opens the breaker for another reset_timeout.
+
+    Attributes:
+        name: Name of the dependency.
+        failure_threshold: Count of consecutive failures to open the breaker.
+        reset_timeout: Time in seconds before the probe.
+        state: Closed, half open or open.
+        failures: Count of consecutive failures.
+        opened_at: Time the breaker was opened or the probe was let through.
+
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 10) -> None:
+        """CircuitBreaker class constructor.
+
+        Args:
+            name: Name of the dependency.
+            failure_threshold: Count of consecutive failures to open the breaker.
+            reset_timeout: Time in seconds before the probe.
+
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = Lock()
+        self.set_state(CLOSED)
+
+    def set_state(self, state: str) -> None:
+        """Change and expose the state.
+
+        Args:
+            state: New state.
+
+        """
+        if state != getattr(self, 'state', CLOSED):
+            logger.warning('Circuit breaker of %s is %s', self.name, state)
+        self.state = state
+        CIRCUIT_STATE.labels(self.name).set(STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """Check that a call can be made, let one probe through after the timeout.
+
+        Returns:
+            bool: The call can be made.
+
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            now = monotonic()
+            if now >= self.opened_at + self.reset_timeout:
+                self.opened_at = now
+                self.set_state(HALF_OPEN)
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        """Time to the next probe.
+
+        Returns:
+            float: Seconds.
+
+        """
+        return max(self.opened_at + self.reset_timeout - monotonic(), 0)
+
+    def success(self) -> None:
+        """Close the breaker after a successful call."""
+        with self.lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self.set_state(CLOSED)
+
+    def failure(self) -> None:
+        """Count a failed call, open the breaker on the threshold or a failed probe."""
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = monotonic()
+                self.set_state(OPEN)
+
+
+BREAKERS = {name: CircuitBreaker(name) for name in ('postgres', 'redis', 'elasticsearch')}
+
 
 # def backoff_calculation(**kwargs) -> int:
 def compute_delay(
@@ -35,16 +159,104 @@ def compute_delay(
     return retry + 1, delay
 
 
-def backoff_reconnect(start_sleep_time=0.1, factor=2, border_sleep_time=10) -> Any:
+def retry_call(
+    func: Callable,
+    reconnect: Optional[Callable],
+    start_sleep_time: float,
+    factor: float,
+    border_sleep_time: float,
+    dependency: Optional[str],
+    deadline: Optional[float],
+) -> Any:
+    """Call the function until it succeeds, sleep a full jitter delay after every failure.
+
+    Args:
+        func: Function without arguments to call.
+        reconnect: Function to connect once before the next try, its failure is
+            counted as a failed try. None: only the delay.
+        start_sleep_time: Initial time to repeat.
+        factor: Multiplier of time.
+        border_sleep_time: Max time.
+        dependency: Name of the circuit breaker. None: no breaker.
+        deadline: Max time in seconds to retry. None: retry forever.
+
+    Returns:
+        Any: Result of the function.
+
+    Raises:
+        CircuitOpenError: The call fails or the breaker is open until the deadline.
+            A CircuitOpenError of a nested call is raised as is, without retries.
+
+    """
+    breaker = BREAKERS.get(dependency)
+    started = monotonic()
+    retry = 1
+    delay = start_sleep_time
+    reconnecting = False
+    while True:
+        if breaker and not breaker.allow():
+            wait = min(breaker.retry_after(), border_sleep_time) + uniform(0, start_sleep_time)
+            if deadline is not None and monotonic() + wait - started > deadline:
+                raise CircuitOpenError(dependency)
+            sleep(wait)
+            continue
+        try:
+            if reconnecting:
+                reconnect()
+                reconnecting = False
+            result = func()
+        except CircuitOpenError:
+            raise
+        except Exception as error:
+            if breaker:
+                breaker.failure()
+            BACKOFF_RETRIES.labels(getattr(func, '__qualname__', str(func))).inc()
+            jitter = uniform(0, min(delay, border_sleep_time))
+            if deadline is not None:
+                remaining = started + deadline - monotonic()
+                if remaining <= 0:
+                    raise CircuitOpenError(dependency) from error
+                jitter = min(jitter, remaining)
+            logger.exception(
+                'Error in {func}. Next try in {sec:.2f} seconds'.format(
+                    sec=jitter,
+                    func=str(func),
+                ),
+            )
+            sleep(jitter)
+            retry, delay = compute_delay(
+                start_sleep_time=start_sleep_time,
+                factor=factor,
+                border_sleep_time=border_sleep_time,
+                delay=delay,
+                retry=retry,
+            )
+            reconnecting = reconnect is not None
+        else:
+            if breaker:
+                breaker.success()
+            return result
+
+
+def backoff_reconnect(
+    start_sleep_time=0.1,
+    factor=2,
+    border_sleep_time=10,
+    dependency: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> Any:
     """Retry with reconnect and delay.
 
     The function tries to call an argument function after reconnect and delay if the argument
-    function caused an exception.
+    function caused an exception. The instance method _connect must connect once without
+    retries, so the reconnect does not outlive the deadline.
 
     Args:
         start_sleep_time: Initial time to repeat.
         factor: Multiplier of time.
         border_sleep_time: Max time.
+        dependency: Name of the shared circuit breaker of the dependency.
+        deadline: Max time in seconds to retry. None: retry forever.
 
     Returns:
         Any: Result of calling function.
@@ -54,32 +266,21 @@ def backoff_reconnect(start_sleep_time=0.1, factor=2, border_sleep_time=10) -> A
     def func_wrapper(func):
         @wraps(func)
         def inner(self, *args, **kwargs):
-            retry = 1
-            delay = start_sleep_time
-            while True:
-                try:
-                    return func(self, *args, **kwargs)
-                except Exception:
-                    logger.exception(
-                        'Error in {func}. Next try in {sec} seconds'.format(
-                            sec=min(delay, border_sleep_time),
-                            func=str(func),
-                        ),
-                    )
-                    sleep(min(delay, border_sleep_time))
-                    retry, delay = compute_delay(
-                        start_sleep_time=start_sleep_time,
-                        factor=factor,
-                        border_sleep_time=border_sleep_time,
-                        delay=delay,
-                        retry=retry,
-                    )
-                    self._connect()
+            call = wraps(func)(lambda: func(self, *args, **kwargs))
+            return retry_call(
+                call, self._connect, start_sleep_time, factor, border_sleep_time, dependency, deadline,
+            )
         return inner
     return func_wrapper
 
 
-def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10) -> Any:
+def backoff(
+    start_sleep_time=0.1,
+    factor=2,
+    border_sleep_time=10,
+    dependency: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> Any:
     """Retry call a function with delay.
 
     The function tries to call an argument function after delay if the argument
@@ -89,6 +290,8 @@ def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10) -> Any:
         start_sleep_time: Initial time to repeat.
         factor: Multiplier of time.
         border_sleep_time: Max time.
+        dependency: Name of the shared circuit breaker of the dependency.
+        deadline: Max time in seconds to retry. None: retry forever.
 
     Returns:
         Any: Result of calling function.
@@ -98,25 +301,29 @@ def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10) -> Any:
     def func_wrapper(func):
         @wraps(func)
         def inner(self, *args, **kwargs):
-            retry = 1
-            delay = start_sleep_time
-            while True:
-                try:
-                    return func(self, *args, **kwargs)
-                except Exception:
-                    logger.exception(
-                        'Error in {func}. Next try in {sec} seconds'.format(
-                            sec=min(delay, border_sleep_time),
-                            func=str(func),
-                        ),
-                    )
-                    sleep(min(delay, border_sleep_time))
-                    retry, delay = compute_delay(
-                        start_sleep_time=start_sleep_time,
-                        factor=factor,
-                        border_sleep_time=border_sleep_time,
-                        delay=delay,
-                        retry=retry,
-                    )
+            call = wraps(func)(lambda: func(self, *args, **kwargs))
+            return retry_call(call, None, start_sleep_time, factor, border_sleep_time, dependency, deadline)
         return inner
     return func_wrapper
+
+
+@contextmanager
+def skip_when_open(delay: float) -> Iterator[None]:
+    """Skip the rest of the cycle when a dependency is unavailable.
+
+    The wait lasts until the breaker lets a probe through, at least the delay.
+
+    Args:
+        delay: Min time in seconds to wait.
+
+    Yields:
+        None: The cycle runs in the context.
+
+    """
+    try:
+        yield
+    except CircuitOpenError as error:
+        breaker = BREAKERS.get(error.dependency)
+        wait = max(breaker.retry_after() if breaker else 0, delay)
+        logger.warning('%s is unavailable, the cycle is skipped for %.2f seconds', error.dependency, wait)
+        sleep(wait)
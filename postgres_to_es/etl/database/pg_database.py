@@ -1,13 +1,17 @@
 """Postgres function implementations."""
 
 import logging
+import select
+import uuid
 from logging.config import dictConfig
+from typing import IO, Iterator, List
 
 import psycopg2
 import psycopg2.sql
 from lib.loggers import LOGGING
-from database.backoff_connection import backoff, backoff_reconnect
-from psycopg2.extras import RealDictCursor
+from database.backoff_connection import DEADLINES, backoff, backoff_reconnect
+from psycopg2.extensions import Notify
+from psycopg2.extras import RealDictCursor, RealDictRow
 
 dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
@@ -20,31 +24,51 @@ class PGConnection(object):
 
     Attributes:
         pg_settings : settings for PG connection.
+        readonly: Open read only sessions.
+        autocommit: Open autocommit sessions.
+        streams: Opened server-side cursors by name.
+        channels: Notification channels to listen.
+        connects: Count of established connections.
 
     """
 
-    @backoff()
     def _connect(self) -> None:
-        """PG connection function with backoff wrapper."""
+        """Connect once, a failure is retried by the caller within its deadline."""
         logger.debug(
             'Connecting to the DB %s. Timeout %s',
             self.pg_settings['dbname'],
             self.pg_settings['connect_timeout'],
         )
         self.connection = psycopg2.connect(**self.pg_settings)
-        self.connection.set_session(readonly=True, autocommit=True)
+        self.connection.set_session(readonly=self.readonly, autocommit=self.autocommit)
+        self.streams = {}
+        self.connects += 1
+        with self.connection.cursor() as cursor:
+            for channel in self.channels:
+                cursor.execute(psycopg2.sql.SQL('LISTEN {0}').format(psycopg2.sql.Identifier(channel)))
 
         logger.debug('Connected to the DB %s', self.pg_settings['dbname'])
 
-    def __init__(self, pg_settings: dict) -> None:
+    @backoff(dependency='postgres')
+    def _connect_with_backoff(self) -> None:
+        """PG connection function with backoff wrapper, waits for the DB on start."""
+        self._connect()
+
+    def __init__(self, pg_settings: dict, readonly: bool = True, autocommit: bool = True) -> None:
         """PGConnection class constructor.
 
         Args:
             pg_settings:  settings for PG connection.
+            readonly: Open read only sessions.
+            autocommit: Open autocommit sessions.
 
         """
         self.pg_settings = pg_settings
-        self._connect()
+        self.readonly = readonly
+        self.autocommit = autocommit
+        self.channels = set()
+        self.connects = 0
+        self._connect_with_backoff()
 
     def __del__(self) -> None:
         """Delete object event wrapper.
@@ -58,7 +82,7 @@ class PGConnection(object):
         except Exception:
             pass
 
-    @backoff_reconnect()
+    @backoff_reconnect(dependency='postgres', deadline=DEADLINES['postgres'])
     def retry_fetchall(self, sql: psycopg2.sql.Composed, **kwargs) -> RealDictCursor:
         """SQL query executor.
 
@@ -76,3 +100,123 @@ class PGConnection(object):
         with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(sql, (kwargs))
             return cursor.fetchall()
+
+    def copy_to(self, sql: str, file: IO) -> None:
+        """Run COPY TO STDOUT and write the output to the file.
+
+        The method has no backoff, a broken COPY has to be started again by
+        the caller with a clean output file.
+
+        Args:
+            sql: COPY query.
+            file: Object with a write method to receive the output.
+
+        """
+        logger.debug('Try to copy sql %s', sql)
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(sql, file)
+
+    def stream(
+        self,
+        sql: psycopg2.sql.Composed,
+        itersize: int = 1000,
+        key: str = 'id',
+        **kwargs,
+    ) -> Iterator[List[RealDictRow]]:
+        """Stream query results in chunks from a named server-side cursor.
+
+        The query has to be ordered by the key column and filtered by the `last_<key>`
+        parameter, so after a reconnect it is executed again from the last yielded key.
+
+        Args:
+            sql: SQL query.
+            itersize: Count of records in a chunk.
+            key: Name of the column to resume from.
+            kwargs: keywordargs to pass into sql query.
+
+        Yields:
+            List[RealDictRow]: Chunk of records from database.
+
+        """
+        name = 'stream_{0}'.format(uuid.uuid4().hex)
+        params = dict(kwargs)
+        try:
+            while chunk := self.fetch_chunk(name, sql, itersize, params):
+                yield chunk
+                params['last_{0}'.format(key)] = chunk[-1][key]
+        finally:
+            self.close_stream(name)
+
+    @backoff_reconnect(dependency='postgres', deadline=DEADLINES['postgres'])
+    def fetch_chunk(self, name: str, sql: psycopg2.sql.Composed, itersize: int, params: dict) -> List[RealDictRow]:
+        """Fetch the next chunk from the server-side cursor.
+
+        The cursor is declared on the first call and after every reconnect.
+
+        Args:
+            name: Name of the server-side cursor.
+            sql: SQL query.
+            itersize: Count of records in a chunk.
+            params: Params to pass into sql query.
+
+        Returns:
+            List[RealDictRow]: Records from database.
+
+        """
+        cursor = self.streams.get(name)
+        if cursor is None:
+            logger.debug('Declare cursor %s for sql %s. SQL PARAMS: %s', name, sql, params)
+            if self.connection.autocommit:
+                self.connection.autocommit = False
+            cursor = self.connection.cursor(name=name, cursor_factory=RealDictCursor)
+            cursor.itersize = itersize
+            cursor.execute(sql, params)
+            self.streams[name] = cursor
+        return cursor.fetchmany(itersize)
+
+    def close_stream(self, name: str) -> None:
+        """Close the server-side cursor and finish its transaction.
+
+        Args:
+            name: Name of the server-side cursor.
+
+        """
+        cursor = self.streams.pop(name, None)
+        try:
+            if cursor is not None:
+                cursor.close()
+            if not self.streams and self.autocommit and not self.connection.autocommit:
+                self.connection.rollback()
+                self.connection.autocommit = True
+        except psycopg2.Error:
+            logger.debug('Cursor %s is closed with the connection', name)
+
+    @backoff_reconnect(dependency='postgres')
+    def listen(self, channel: str) -> None:
+        """Subscribe to the notification channel, also after every reconnect.
+
+        Args:
+            channel: Name of the channel.
+
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(psycopg2.sql.SQL('LISTEN {0}').format(psycopg2.sql.Identifier(channel)))
+        self.channels.add(channel)
+
+    @backoff_reconnect(dependency='postgres')
+    def notifications(self, timeout: float) -> List[Notify]:
+        """Wait for notifications without running queries.
+
+        Args:
+            timeout: Max time to wait in seconds.
+
+        Returns:
+            List[Notify]: Received notifications.
+
+        """
+        if not self.connection.notifies:
+            select.select([self.connection], [], [], timeout)
+            self.connection.poll()
+        notifies = list(self.connection.notifies)
+        self.connection.notifies.clear()
+        return notifies
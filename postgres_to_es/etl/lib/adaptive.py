@@ -0,0 +1,79 @@
+"""Adaptive batch sizes."""
+
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class AIMDSize(object):
+    """Batch size controlled by additive increase / multiplicative decrease.
+
+    The size grows by a step while batches are processed faster than the target
+    latency without errors, and is cut by a factor on a slow or failed batch.
+
+    Attributes:
+        name: Name of the size to log.
+        value: Current size.
+        minimum: Lower bound of the size.
+        maximum: Upper bound of the size.
+        step: Additive increase.
+        factor: Multiplicative decrease.
+        target_latency: Max time in seconds to process a batch.
+
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        step: int,
+        factor: float = 0.5,
+        target_latency: float = 1,
+    ) -> None:
+        """AIMDSize class constructor.
+
+        Args:
+            name: Name of the size to log.
+            initial: Initial size.
+            minimum: Lower bound of the size.
+            maximum: Upper bound of the size.
+            step: Additive increase.
+            factor: Multiplicative decrease.
+            target_latency: Max time in seconds to process a batch.
+
+        """
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.value = min(max(initial, minimum), maximum)
+        self.step = step
+        self.factor = factor
+        self.target_latency = target_latency
+        self.lock = Lock()
+
+    def observe(self, latency: float, error_rate: float = 0) -> int:
+        """Adjust the size by the result of a batch.
+
+        Args:
+            latency: Time in seconds the batch was processed.
+            error_rate: Share of the failed or rejected items of the batch.
+
+        Returns:
+            int: New size.
+
+        """
+        with self.lock:
+            if error_rate or latency > self.target_latency:
+                value = max(int(self.value * self.factor), self.minimum)
+                if value != self.value:
+                    logger.info(
+                        'Decrease %s to %s, latency %.2f, error rate %.2f',
+                        self.name, value, latency, error_rate,
+                    )
+            else:
+                value = min(self.value + self.step, self.maximum)
+            self.value = value
+            return value
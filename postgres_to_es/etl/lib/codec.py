@@ -0,0 +1,96 @@
+"""Compact encoding of the state values."""
+
+import datetime
+import pickle
+import uuid
+from decimal import Decimal
+from typing import Any
+
+import msgpack
+
+VERSION = b'\x01'
+
+EXT_DATETIME = 1
+EXT_DATE = 2
+EXT_DECIMAL = 3
+EXT_UUID = 4
+
+
+def _default(value: Any) -> msgpack.ExtType:
+    """Pack types unknown to msgpack.
+
+    Args:
+        value: Value to pack.
+
+    Returns:
+        msgpack.ExtType: Packed value.
+
+    Raises:
+        TypeError: The type is not supported.
+
+    """
+    if isinstance(value, datetime.datetime):
+        return msgpack.ExtType(EXT_DATETIME, value.isoformat().encode('utf-8'))
+    if isinstance(value, datetime.date):
+        return msgpack.ExtType(EXT_DATE, value.isoformat().encode('utf-8'))
+    if isinstance(value, Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(value).encode('utf-8'))
+    if isinstance(value, uuid.UUID):
+        return msgpack.ExtType(EXT_UUID, value.bytes)
+    raise TypeError('Unable to encode {0!r}'.format(value))
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    """Unpack types unknown to msgpack.
+
+    Args:
+        code: Ext type code.
+        data: Packed value.
+
+    Returns:
+        Any: Unpacked value.
+
+    """
+    if code == EXT_DATETIME:
+        return datetime.datetime.fromisoformat(data.decode('utf-8'))
+    if code == EXT_DATE:
+        return datetime.date.fromisoformat(data.decode('utf-8'))
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode('utf-8'))
+    if code == EXT_UUID:
+        return uuid.UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+def encode(value: Any) -> bytes:
+    """Encode the value with msgpack and the format version.
+
+    Args:
+        value: Value to encode.
+
+    Returns:
+        bytes: Encoded value.
+
+    """
+    return VERSION + msgpack.packb(value, default=_default, use_bin_type=True)
+
+
+def decode(raw: bytes) -> Any:
+    """Decode the value saved by encode or pickled by previous versions.
+
+    Args:
+        raw: Encoded value.
+
+    Returns:
+        Any: Decoded value.
+
+    Raises:
+        ValueError: The value is not encoded.
+
+    """
+    if raw[:1] == VERSION:
+        return msgpack.unpackb(raw[1:], ext_hook=_ext_hook, raw=False)
+    try:
+        return pickle.loads(raw)
+    except pickle.UnpicklingError as error:
+        raise ValueError('Unknown state format') from error
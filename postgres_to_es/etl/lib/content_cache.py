@@ -0,0 +1,132 @@
+"""Content hash cache of the indexed documents."""
+
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Tuple
+
+from lib.storage import RedisStorage
+
+DIGEST_SIZE = 8
+
+
+class ContentHashCache(object):
+    """Digests of the documents loaded to the index.
+
+    All the digests are kept in a Redis hash, so the cache survives restarts.
+    Recently used digests are kept in a local LRU to save Redis round trips.
+
+    Attributes:
+        storage: Redis storage of the digests.
+        size: Max count of the digests in the local LRU.
+        local: Local LRU of the digests.
+        checked: Count of the checked documents.
+        skipped: Count of the unchanged documents.
+
+    """
+
+    def __init__(self, storage: RedisStorage, size: int = 100000) -> None:
+        """ContentHashCache class constructor.
+
+        Args:
+            storage: Redis storage of the digests.
+            size: Max count of the digests in the local LRU.
+
+        """
+        self.storage = storage
+        self.size = size
+        self.local = OrderedDict()
+        self.checked = 0
+        self.skipped = 0
+
+    @property
+    def skip_rate(self) -> float:
+        """Share of the unchanged documents among all the checked ones."""
+        return self.skipped / self.checked if self.checked else 0
+
+    @staticmethod
+    def digest(data: bytes) -> bytes:
+        """Compute a compact digest of the data.
+
+        Args:
+            data: Serialized document.
+
+        Returns:
+            bytes: Digest of the data.
+
+        """
+        return blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+    def cached(self, keys: List[str]) -> Dict[str, bytes]:
+        """Get the digests from the local LRU, the missing ones from Redis.
+
+        Args:
+            keys: Ids of the documents.
+
+        Returns:
+            Dict[str, bytes]: Known digests by the ids.
+
+        """
+        digests = {}
+        missing = []
+        for key in keys:
+            if key in self.local:
+                self.local.move_to_end(key)
+                digests[key] = self.local[key]
+            else:
+                missing.append(key)
+        if missing:
+            values = self.storage.try_command(self.storage.redis_adapter.hmget, self.storage.name, missing)
+            digests.update((key, value) for key, value in zip(missing, values) if value is not None)
+        return digests
+
+    def changed(self, items: Iterable[Tuple[str, bytes]]) -> Tuple[list, Dict[str, bytes]]:
+        """Filter out the items with unchanged content.
+
+        Args:
+            items: Pairs of the document id and the serialized document.
+
+        Returns:
+            Tuple[list, Dict[str, bytes]]: Changed items and their new digests.
+
+        """
+        items = list(items)
+        digests = {key: self.digest(data) for key, data in items}
+        cached = self.cached(list(digests))
+        changed = [(key, data) for key, data in items if cached.get(key) != digests[key]]
+        self.checked += len(items)
+        self.skipped += len(items) - len(changed)
+        return changed, {key: digests[key] for key, _ in changed}
+
+    def remember(self, digests: Dict[str, bytes]) -> None:
+        """Save digests of the loaded documents.
+
+        Args:
+            digests: Digests by the document ids.
+
+        """
+        if not digests:
+            return
+        self.storage.try_command(self.storage.redis_adapter.hset, self.storage.name, mapping=digests)
+        self.local.update(digests)
+        for key in digests:
+            self.local.move_to_end(key)
+        while len(self.local) > self.size:
+            self.local.popitem(last=False)
+
+    def forget(self, keys: List[str]) -> None:
+        """Forget digests of the documents changed outside of the loader.
+
+        Args:
+            keys: Ids of the documents.
+
+        """
+        if not keys:
+            return
+        self.storage.try_command(self.storage.redis_adapter.hdel, self.storage.name, *keys)
+        for key in keys:
+            self.local.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget all the digests."""
+        self.storage.try_command(self.storage.redis_adapter.delete, self.storage.name)
+        self.local.clear()
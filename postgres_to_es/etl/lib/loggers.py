@@ -35,6 +35,21 @@ LOGGING = types.MappingProxyType({
             'handlers': [LOG_STDOUT],
             'propagate': False,
         },
+        'lib.adaptive': {
+            'level': log_level,
+            'handlers': [LOG_STDOUT],
+            'propagate': False,
+        },
+        'lib.profiling': {
+            'level': log_level,
+            'handlers': [LOG_STDOUT],
+            'propagate': False,
+        },
+        'processors.coalescer': {
+            'level': log_level,
+            'handlers': [LOG_STDOUT],
+            'propagate': False,
+        },
         'processors.enricher': {
             'level': log_level,
             'handlers': [LOG_STDOUT],
@@ -45,11 +60,41 @@ LOGGING = types.MappingProxyType({
             'handlers': [LOG_STDOUT],
             'propagate': False,
         },
+        'processors.listener': {
+            'level': log_level,
+            'handlers': [LOG_STDOUT],
+            'propagate': False,
+        },
         'processors.loader': {
             'level': log_level,
             'handlers': [LOG_STDOUT],
             'propagate': False,
         },
+        'processors.outbox': {
+            'level': log_level,
+            'handlers': [LOG_STDOUT],
+            'propagate': False,
+        },
+        'processors.pipeline': {
+            'level': log_level,
+            'handlers': [LOG_STDOUT],
+            'propagate': False,
+        },
+        'processors.reindexer': {
+            'level': log_level,
+            'handlers': [LOG_STDOUT],
+            'propagate': False,
+        },
+        'processors.search_doc': {
+            'level': log_level,
+            'handlers': [LOG_STDOUT],
+            'propagate': False,
+        },
+        'processors.tombstones': {
+            'level': log_level,
+            'handlers': [LOG_STDOUT],
+            'propagate': False,
+        },
         'processors.transformer': {
             'level': log_level,
             'handlers': [LOG_STDOUT],
@@ -0,0 +1,21 @@
+"""Prometheus metrics of the ETL process."""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+STAGE_LATENCY = Histogram(
+    'etl_stage_latency_seconds',
+    'Time to process one batch by the ETL stage.',
+    ['stage'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+DOCUMENTS = Counter('etl_documents_total', 'Documents loaded to the index.')
+DOCUMENTS_DELETED = Counter('etl_documents_deleted_total', 'Documents of the deleted movies removed from the index.')
+DOCUMENTS_SKIPPED = Counter('etl_documents_skipped_total', 'Unchanged documents skipped by the loader.')
+BULK_ERRORS = Counter('etl_bulk_errors_total', 'Bulk actions failed after all the retries.', ['status'])
+BACKOFF_RETRIES = Counter('etl_backoff_retries_total', 'Calls retried by the backoff decorators.', ['function'])
+ENTITY_LAG = Gauge('etl_entity_lag_seconds', 'Time since the modified watermark of the entity.', ['entity'])
+CALLS = Counter('etl_calls_total', 'Calls of the instrumented functions.', ['function'])
+CALL_SECONDS = Counter('etl_call_seconds_total', 'Time spent in the instrumented functions.', ['function'])
+CIRCUIT_STATE = Gauge(
+    'etl_circuit_state', 'State of the dependency circuit breaker: 0 closed, 1 half open, 2 open.', ['dependency'],
+)
@@ -0,0 +1,131 @@
+"""On-demand profiling of the ETL stages."""
+
+import cProfile
+import logging
+import os
+import pstats
+import threading
+from datetime import datetime
+from functools import wraps
+from time import perf_counter
+from typing import Callable
+
+from lib.metrics import CALL_SECONDS, CALLS
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler(object):
+    """Count calls of the wrapped functions and profile them on demand.
+
+    Calls and time are always counted. A request (on start or by a signal)
+    enables cProfile in the wrapped functions for the given count of cycles,
+    then the stats are dumped to a pstats file. Every thread has its own
+    profile, profiles are merged in the dump.
+
+    Attributes:
+        cycles: Count of cycles to profile.
+        directory: Directory of the dumps.
+        requested: Profiling is requested.
+        remaining: Cycles left to profile. 0: profiling is off.
+        profiles: Profiles by the thread id.
+        local: Depth of the wrapped calls of the thread.
+
+    """
+
+    def __init__(self, cycles: int = 3, directory: str = '/tmp', requested: bool = False) -> None:
+        """Profiler class constructor.
+
+        Args:
+            cycles: Count of cycles to profile.
+            directory: Directory of the dumps.
+            requested: Profile the first cycles.
+
+        """
+        self.cycles = cycles
+        self.directory = directory
+        self.requested = requested
+        self.remaining = 0
+        self.profiles = {}
+        self.local = threading.local()
+        self.cycle()
+
+    def request(self, *args) -> None:
+        """Request profiling of the next cycles, it is a signal handler too.
+
+        Args:
+            args: Signal number and frame.
+
+        """
+        self.requested = True
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """Count calls of the function and profile them while profiling is on.
+
+        Args:
+            name: Name of the function in metrics.
+            func: Function to wrap.
+
+        Returns:
+            Callable: Wrapped function.
+
+        """
+        @wraps(func)
+        def inner(*args, **kwargs):
+            depth = getattr(self.local, 'depth', 0)
+            profile = None
+            if not depth and self.remaining:
+                ident = threading.get_ident()
+                if ident not in self.profiles:
+                    self.profiles[ident] = cProfile.Profile()
+                profile = self.profiles[ident]
+                profile.enable()
+            self.local.depth = depth + 1
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                CALL_SECONDS.labels(name).inc(perf_counter() - started)
+                CALLS.labels(name).inc()
+                self.local.depth = depth
+                if profile:
+                    profile.disable()
+        return inner
+
+    def instrument(self, obj: object, method: str, name: str) -> None:
+        """Replace the method of the object with the wrapped one.
+
+        Args:
+            obj: Object to instrument.
+            method: Name of the method.
+            name: Name of the function in metrics.
+
+        """
+        setattr(obj, method, self.wrap(name, getattr(obj, method)))
+
+    def cycle(self) -> None:
+        """Mark the end of a cycle, start or finish profiling.
+
+        Must be called when no wrapped function is running.
+
+        """
+        if self.remaining:
+            self.remaining -= 1
+            if not self.remaining:
+                self.dump()
+        if self.requested and not self.remaining:
+            logger.info('Profile %s cycles', self.cycles)
+            self.requested = False
+            self.remaining = self.cycles
+
+    def dump(self) -> None:
+        """Save the merged stats of all the threads."""
+        profiles, self.profiles = list(self.profiles.values()), {}
+        if not profiles:
+            return
+        path = os.path.join(
+            self.directory,
+            'etl-{0}-{1:%Y%m%d%H%M%S}.pstats'.format(os.getpid(), datetime.now()),
+        )
+        pstats.Stats(*profiles).dump_stats(path)
+        logger.info('Profile is saved to %s', path)
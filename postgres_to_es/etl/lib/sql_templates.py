@@ -1,12 +1,43 @@
 """SQL query templates."""
 
+shard_filter = """
+    AND mod(hashtext({column}::text)::bigint + 2147483648, %(shard_count)s) = %(shard_index)s
+"""
+
 get_modified_records = """
-    SELECT id, modified FROM {table}
-    WHERE modified > %(modified)s
-    ORDER BY modified
+    SELECT id, {modified} AS modified FROM {table}
+    WHERE ({modified}, id) > (%(modified)s, %(id)s)
+    {shard_filter}
+    ORDER BY {modified}, id
     LIMIT %(page_size)s
 """
 
+get_last_record = """
+    SELECT id, {modified} AS modified FROM {table}
+    ORDER BY {modified} DESC, id DESC
+    LIMIT 1
+"""
+
+table_exists = 'SELECT to_regclass(%(table)s) IS NOT NULL AS exists'
+
+get_film_work_ids = """
+    SELECT DISTINCT film_work_id FROM {link_table}
+    WHERE {link_column} = ANY(%(pkeys)s::uuid[])
+    {shard_filter}
+"""
+
+get_names = """
+    SELECT id, {name_column} AS name FROM {table}
+    WHERE id = ANY(%(pkeys)s::uuid[])
+"""
+
+get_person_film_works = """
+    SELECT film_work_id, bool_or(role = 'director') AS directed FROM content.person_film_work
+    WHERE person_id = %(pkey)s
+    {shard_filter}
+    GROUP BY film_work_id
+"""
+
 get_movie_info_by_id = """
     SELECT
         film_work.id as id,
@@ -30,9 +61,107 @@ get_movie_info_by_id = """
         LEFT JOIN content.person ON person.id = pfw.person_id
         LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = film_work.id
         LEFT JOIN content.genre  ON genre.id = gfw.genre_id
-    WHERE {where_clause_table}.id in %(pkeys)s
-    AND film_work.id::text > %(last_id)s
+    WHERE film_work.id = ANY(%(film_ids)s::uuid[])
+    AND film_work.id > %(last_id)s
     GROUP BY film_work.id
-    ORDER BY film_work.id
-    LIMIT %(page_size)s;
+    ORDER BY film_work.id;
+"""
+
+get_movie_info_by_id_lateral = """
+    SELECT
+        film_work.id as id,
+        film_work.rating as imdb_rating,
+        film_work.title as title,
+        film_work.description as description,
+        film_work.modified,
+        COALESCE(persons.persons, '[]') as persons,
+        COALESCE(genres.genre, '{}') as genre
+    FROM content.film_work
+        LEFT JOIN LATERAL (
+            SELECT json_agg(
+                DISTINCT jsonb_build_object(
+                    'role', pfw.role,
+                    'id', person.id,
+                    'name', person.full_name
+                )
+            ) as persons
+            FROM content.person_film_work pfw
+                JOIN content.person ON person.id = pfw.person_id
+            WHERE pfw.film_work_id = film_work.id
+        ) persons ON true
+        LEFT JOIN LATERAL (
+            SELECT array_agg(DISTINCT genre.name) as genre
+            FROM content.genre_film_work gfw
+                JOIN content.genre ON genre.id = gfw.genre_id
+            WHERE gfw.film_work_id = film_work.id
+        ) genres ON true
+    WHERE film_work.id = ANY(%(film_ids)s::uuid[])
+    AND film_work.id > %(last_id)s
+    ORDER BY film_work.id;
+"""
+
+get_search_docs = """
+    SELECT id, modified, document::text AS document FROM {table}
+    WHERE (modified, id) > (%(modified)s, %(id)s)
+    {shard_filter}
+    ORDER BY modified, id
+    LIMIT %(page_size)s
+"""
+
+enable_search_doc = 'SELECT content.enable_movie_search_doc()'
+
+delete_tombstones = 'DELETE FROM content.tombstone WHERE deleted_at < %(cut)s'
+
+enable_outbox = 'SELECT content.enable_search_outbox()'
+
+claim_outbox = """
+    SELECT id, film_work_id FROM content.search_outbox
+    ORDER BY id
+    LIMIT %(page_size)s
+    FOR UPDATE SKIP LOCKED
+"""
+
+delete_outbox = """
+    DELETE FROM content.search_outbox
+    WHERE id = ANY(%(ids)s)
+"""
+
+copy_movie_documents = """
+    COPY (
+        SELECT
+            film_work.id,
+            json_build_object(
+                'id', film_work.id,
+                'imdb_rating', film_work.rating,
+                'genre', COALESCE(genres.genre, '{}'),
+                'title', film_work.title,
+                'description', film_work.description,
+                'director', COALESCE(persons.director, '{}'),
+                'actors_names', COALESCE(persons.actors_names, '{}'),
+                'writers_names', COALESCE(persons.writers_names, '{}'),
+                'actors', COALESCE(persons.actors, '[]'),
+                'writers', COALESCE(persons.writers, '[]')
+            )
+        FROM content.film_work
+            LEFT JOIN (
+                SELECT
+                    pfw.film_work_id,
+                    array_agg(person.full_name) FILTER (WHERE pfw.role = 'director') as director,
+                    array_agg(person.full_name) FILTER (WHERE pfw.role = 'actor') as actors_names,
+                    array_agg(person.full_name) FILTER (WHERE pfw.role = 'writer') as writers_names,
+                    json_agg(json_build_object('id', person.id, 'name', person.full_name))
+                        FILTER (WHERE pfw.role = 'actor') as actors,
+                    json_agg(json_build_object('id', person.id, 'name', person.full_name))
+                        FILTER (WHERE pfw.role = 'writer') as writers
+                FROM content.person_film_work pfw
+                    JOIN content.person ON person.id = pfw.person_id
+                GROUP BY pfw.film_work_id
+            ) persons ON persons.film_work_id = film_work.id
+            LEFT JOIN (
+                SELECT gfw.film_work_id, array_agg(DISTINCT genre.name) as genre
+                FROM content.genre_film_work gfw
+                    JOIN content.genre ON genre.id = gfw.genre_id
+                GROUP BY gfw.film_work_id
+            ) genres ON genres.film_work_id = film_work.id
+    ) TO STDOUT WITH (FORMAT csv, DELIMITER E'\\x02', QUOTE E'\\x01')
 """
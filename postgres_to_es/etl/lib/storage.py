@@ -2,14 +2,16 @@
 
 import abc
 import logging
-import pickle
-from typing import Any, Callable
+from typing import Any, Callable, Iterable, List
 
-from database.backoff_connection import backoff, backoff_reconnect
+from database.backoff_connection import DEADLINES, backoff, backoff_reconnect
+from lib import codec
 from redis import Redis
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_NAME = 'state'
+
 
 class BaseStorage:
     @abc.abstractmethod
@@ -22,33 +24,55 @@ class BaseStorage:
         """Get state from storage"""
         pass
 
+    @abc.abstractmethod
+    def add_members(self, key: str, members: Iterable[str]) -> None:
+        """Add members to the set of the key"""
+        pass
+
+    @abc.abstractmethod
+    def members(self, key: str) -> List[str]:
+        """Get sorted members of the set of the key"""
+        pass
+
 
 class RedisStorage(BaseStorage):
     """Implement Redis Storage tools.
 
+    The state is kept in one Redis hash, it is saved with one transaction and
+    retrieved with one HGETALL. Growing collections are kept in Redis sets
+    beside the hash, so adding to them does not rewrite them.
+
     Attributes:
         connection_settings: Redis db connection parameters.
+        name: Name of the hash with the state.
 
     """
 
-    def __init__(self, connection_settings: dict) -> None:
+    def __init__(self, connection_settings: dict, name: str = DEFAULT_NAME) -> None:
         """RedisStorage class constructor.
 
         Args:
-            dict: storage connection settings.
+            connection_settings: storage connection settings.
+            name: Name of the hash with the state.
 
         """
         self.connection_settings = connection_settings
-        self._connect()
+        self.name = name
+        self._connect_with_backoff()
 
-    @backoff()
-    def _connect(self):
+    def _connect(self) -> None:
+        """Connect once, a failure is retried by the caller within its deadline."""
         self.redis_adapter = Redis(**self.connection_settings)
         self.redis_adapter.ping()
 
-    @backoff_reconnect()
+    @backoff(dependency='redis')
+    def _connect_with_backoff(self) -> None:
+        """Connect with backoff wrapper, waits for Redis on start."""
+        self._connect()
+
+    @backoff_reconnect(dependency='redis', deadline=DEADLINES['redis'])
     def try_command(self, func: Callable, *args, **kwargs) -> Any:
-        """Wrap a method to implement backoff reconnection.
+        """Wrap a method to implement backoff reconnection, give up after the deadline.
 
         Args:
             func: Decorating method.
@@ -61,33 +85,128 @@ class RedisStorage(BaseStorage):
         """
         return func(*args, **kwargs)
 
-    def save_state(self, state: dict) -> None:
+    def _save(self, state: dict, delete_keys: Iterable[str] = ()) -> None:
+        """Write the state to the hash in one transaction.
+
+        Args:
+            state: Key/value data for saving in the storage.
+            delete_keys: Redis keys to delete in the same transaction.
+
+        """
+        pipeline = self.redis_adapter.pipeline(transaction=True)
+        mapping = {key: codec.encode(value) for key, value in state.items() if value is not None}
+        if mapping:
+            pipeline.hset(self.name, mapping=mapping)
+        empty = [key for key, value in state.items() if value is None]
+        if empty:
+            pipeline.hdel(self.name, *empty)
+        if delete_keys:
+            pipeline.delete(*delete_keys)
+        pipeline.execute()
+
+    def save_state(self, state: dict, cleared: Iterable[str] = ()) -> None:
         """Save state to storage.
 
         Args:
             state: Key/value data for saving in the storage.
+            cleared: Keys of the sets to empty in the same transaction.
 
         """
-        for key, value in state.items():
-            self.try_command(self.redis_adapter.set, name=key, value=pickle.dumps(value))
+        self.try_command(self._save, state, [self.set_name(key) for key in cleared])
 
-    def retrieve_state(self) -> dict:
-        """Load data from the storage.
+    def set_name(self, key: str) -> str:
+        """Get the Redis key of the set kept beside the hash.
+
+        Args:
+            key: Key of the set in the state.
 
         Returns:
-            dict: Key/value loaded data.
+            str: Name of the Redis set.
+
+        """
+        return '{0}:{1}'.format(self.name, key)
+
+    def add_members(self, key: str, members: Iterable[str]) -> None:
+        """Add members to the set of the key.
+
+        Args:
+            key: Key of the set in the state.
+            members: Members to add.
+
+        """
+        members = list(members)
+        if members:
+            self.try_command(self.redis_adapter.sadd, self.set_name(key), *members)
+
+    def members(self, key: str) -> List[str]:
+        """Get members of the set of the key.
+
+        Args:
+            key: Key of the set in the state.
+
+        Returns:
+            List[str]: Sorted members.
+
+        """
+        return sorted(
+            member.decode('utf-8') for member in self.try_command(self.redis_adapter.smembers, self.set_name(key))
+        )
+
+    def _load(self, raw: dict) -> dict:
+        """Decode raw values of the storage.
+
+        Args:
+            raw: Key/value raw data.
+
+        Returns:
+            dict: Key/value decoded data.
 
         """
         state = {}
-        keys = self.try_command(self.redis_adapter.keys, '*')
-        for key in keys:
-            value = self.try_command(self.redis_adapter.get, key)
+        for key, value in raw.items():
             try:
-                state[key.decode('utf-8')] = pickle.loads(value)
-            except pickle.UnpicklingError:
+                state[key.decode('utf-8')] = codec.decode(value)
+            except ValueError:
                 state[key.decode('utf-8')] = value.decode('utf-8') if value else None
         return state
 
+    def _retrieve_legacy(self) -> dict:
+        """Move the state saved key by key by previous versions to the hash.
+
+        Returns:
+            dict: Key/value loaded data.
+
+        """
+        keys = self.try_command(lambda: list(self.redis_adapter.scan_iter(count=1000, _type='STRING')))
+        if not keys:
+            return {}
+        state = self._load(dict(zip(keys, self.try_command(self.redis_adapter.mget, keys))))
+        logger.info('Move %s keys to the state hash %s', len(keys), self.name)
+        self.try_command(self._save, state, keys)
+        return state
+
+    @backoff_reconnect(dependency='redis')
+    def _retrieve(self) -> dict:
+        """Read the raw hash, the processors do not start without it, so there is no deadline.
+
+        Returns:
+            dict: Key/value raw data.
+
+        """
+        return self.redis_adapter.hgetall(self.name)
+
+    def retrieve_state(self) -> dict:
+        """Load data from the storage.
+
+        Returns:
+            dict: Key/value loaded data.
+
+        """
+        raw = self._retrieve()
+        if not raw and self.name == DEFAULT_NAME:
+            return self._retrieve_legacy()
+        return self._load(raw)
+
 
 class State(object):
     """Class to work with data.
@@ -118,8 +237,18 @@ class State(object):
             value: Value for the key.
 
         """
-        self.state[key] = value
-        self.storage.save_state({key: value})
+        self.set_states(**{key: value})
+
+    def set_states(self, cleared: Iterable[str] = (), **kwargs) -> None:
+        """Set and save several key/value pairs in one storage call.
+
+        Args:
+            cleared: Keys of the sets to empty in the same call.
+            kwargs: Key/value pairs to save.
+
+        """
+        self.storage.save_state(kwargs, cleared)
+        self.state.update(kwargs)
 
     def get_state(self, key: str) -> Any:
         """Get the state by key.
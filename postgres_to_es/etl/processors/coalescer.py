@@ -0,0 +1,122 @@
+"""Coalesce changed records process."""
+
+import logging
+from logging.config import dictConfig
+from time import time
+from typing import Callable, Optional
+
+from lib.loggers import LOGGING
+from lib import storage
+
+dictConfig(LOGGING)
+logger = logging.getLogger(__name__)
+
+
+class Coalescer(object):
+    """Accumulate primary keys of changed records and emit them in merged batches.
+
+    A burst of edits of one person moves the person to every page of the burst.
+    Keys are collected per table for the window after the first change or until
+    max_size keys, duplicates are merged, so the affected movies are enriched once.
+    Pending keys are kept in the state before the Extractor watermark moves forward,
+    the Extractor saves the watermark after the keys are handed over.
+
+    Attributes:
+        result_handler: Merged keys will return to the callable.
+        storage: Permanent storage to keep state.
+        state: State of the process
+        window: Time in seconds to collect keys after the first change. 0: keys are not collected.
+        max_size: Count of collected keys to emit them before the window ends.
+
+    """
+
+    def __init__(
+        self,
+        redis_settings: dict,
+        result_handler: Callable,
+        window: float = 0,
+        max_size: int = 10000,
+        state_name: str = 'state',
+    ) -> None:
+        """Coalescer class constructor.
+
+        Args:
+            redis_settings: Redis connection settings.
+            result_handler: Merged keys will return to the function.
+            window: Time in seconds to collect keys after the first change. 0: keys are not collected.
+            max_size: Count of collected keys to emit them before the window ends.
+            state_name: Name of the state in the storage.
+
+        """
+        self.result_handler = result_handler
+        self.window = window
+        self.max_size = max_size
+        self.storage = storage.RedisStorage(redis_settings, name=state_name)
+        self.state = storage.State(self.storage)
+        if not self.window:
+            self.flush()
+
+    def size(self) -> int:
+        """Count collected keys.
+
+        Returns:
+            int: Count of keys of all the tables.
+
+        """
+        return sum(len(pkeys) for pkeys in (self.state.get_state('pending') or {}).values())
+
+    def due(self) -> bool:
+        """Check that the window of the collected keys is over.
+
+        Returns:
+            bool: Collected keys should be emitted.
+
+        """
+        since = self.state.get_state('since')
+        return since is not None and time() - since >= self.window
+
+    def remaining(self) -> Optional[float]:
+        """Compute time left to the end of the window.
+
+        Returns:
+            Optional[float]: Seconds to emit the collected keys. None: there are no keys.
+
+        """
+        since = self.state.get_state('since')
+        if since is None:
+            return None
+        return max(since + self.window - time(), 0)
+
+    def proccess(self, where_clause_table: str, pkeys: list) -> None:
+        """Collect primary keys of changed records.
+
+        Args:
+            where_clause_table: Table name of the changed records.
+            pkeys: Primary keys of the changed records.
+
+        """
+        if not self.window:
+            self.result_handler(where_clause_table, pkeys)
+            return
+
+        pending = self.state.get_state('pending') or {}
+        pending[where_clause_table] = sorted(set(pending.get(where_clause_table, [])).union(pkeys))
+        since = self.state.get_state('since') or time()
+        self.state.set_states(pending=pending, since=since)
+        if self.size() >= self.max_size:
+            self.flush()
+
+    def tick(self) -> None:
+        """Emit collected keys if the window is over."""
+        if self.due():
+            self.flush()
+
+    def flush(self) -> None:
+        """Emit collected keys table by table."""
+        pending = self.state.get_state('pending')
+        if not pending:
+            return
+        logger.info('Emit %s coalesced keys', self.size())
+        for table, pkeys in pending.items():
+            self.result_handler(table, pkeys)
+        self.state.set_states(pending=None, since=None)
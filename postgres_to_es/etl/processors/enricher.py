@@ -1,55 +1,142 @@
 """Enrich data process."""
 
 import logging
+from bisect import bisect_right
 from logging.config import dictConfig
-from typing import Callable
+from functools import partial
+from typing import Callable, Iterator, List, Optional, Tuple
 
 from lib.loggers import LOGGING
 from database.pg_database import PGConnection
 from lib import sql_templates, storage
+from lib.metrics import STAGE_LATENCY
+from processors.extractor import MIN_ID
 from psycopg2.sql import SQL, Identifier
 
 dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
 
+RELATIONS = {
+    'person': ('person_film_work', 'person_id'),
+    'genre': ('genre_film_work', 'genre_id'),
+    'tombstone': ('tombstone', 'id'),
+}
+ENRICH_QUERIES = {
+    'join': sql_templates.get_movie_info_by_id,
+    'lateral': sql_templates.get_movie_info_by_id_lateral,
+}
+NAMES = {
+    'person': 'full_name',
+    'genre': 'name',
+}
+
+
+def missing(film_ids: List[str], after: str, movies: List[dict], until: Optional[str] = None) -> List[str]:
+    """Get ids of the deleted film works of the range.
+
+    Args:
+        film_ids: Sorted film work ids requested from the database.
+        after: Film work id the range starts after.
+        movies: Movies of the range fetched from the database.
+        until: Last film work id of the range. None: the range is open.
+
+    Returns:
+        List[str]: Film work ids of the range without movies.
+
+    """
+    found = {movie['id'] for movie in movies}
+    end = len(film_ids) if until is None else bisect_right(film_ids, until)
+    return [film_id for film_id in film_ids[bisect_right(film_ids, after):end] if film_id not in found]
+
 
 class Enricher(object):
     """Implement getting additional information about movies.
 
+    Changed records are resolved to film work ids first. The ids are collected
+    in a storage set during the cycle, each page adds only its own ids, then
+    they are sorted once and movies are fetched by the film work primary key.
+    The flush checkpoint moves forward only when result_handler acknowledges
+    the batch, so batches waiting in pipeline stages are fetched again after a restart.
+    Collected film works missing in the database are deleted, they are passed
+    to result_handler with the movies of the same range.
+
+    Only the name of a person or a genre gets to the index. When renamer is set,
+    the names are cached, and a changed name is replaced in the index in place
+    instead of enriching all the movies of the record again.
+
     Attributes:
         pg: Used to work with PG Database.
         result_handler: Result of proccessing will return to the callable.
         storage: Permanent storage to keep state.
         state: State of the process
         page_size: Count of records to return.
+        shard_index: Shard of film works to process.
+        shard_count: Count of shards.
+        renamer: Replaces a name in the indexed movies. None: renamed records are enriched.
+        names: Cached names of persons and genres by the table, every shard keeps its own names.
+        query: Query to fetch movies by film work ids.
 
     """
 
-    def __init__(self, pg: PGConnection, redis_settings: dict, result_handler: Callable, page_size: int = 100) -> None:
+    def __init__(
+        self,
+        pg: PGConnection,
+        redis_settings: dict,
+        result_handler: Callable,
+        page_size: int = 100,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        state_name: str = 'state',
+        renamer: Optional[Callable] = None,
+        query: str = 'join',
+    ) -> None:
         """Enricher class constructor.
 
         Args:
             pg: Used to work with PG Database.
             result_handler: Result of the proccessing will return to the function.
             redis_settings: Redis connection settings.
+            page_size: Count of records to return.
+            shard_index: Shard of film works to process.
+            shard_count: Count of shards.
+            state_name: Name of the state in the storage.
+            renamer: Replaces a name in the indexed movies, returns False on failure.
+                None: renamed records are enriched.
+            query: Name of the query to fetch movies: join (one join of all the relations)
+                or lateral (persons and genres are aggregated per movie in lateral subqueries).
 
         """
         self.pg = pg
         self.result_handler = result_handler
-        self.storage = storage.RedisStorage(redis_settings)
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.storage = storage.RedisStorage(redis_settings, name=state_name)
         self.state = storage.State(self.storage)
         self.page_size = page_size
+        self.renamer = renamer
+        self.query = ENRICH_QUERIES[query]
+        self.names = {}
+        if renamer:
+            self.names = {
+                table: storage.State(
+                    storage.RedisStorage(redis_settings, name='{0}:names:{1}'.format(state_name, table)),
+                )
+                for table in NAMES
+            }
         self.proceed()
 
     def proceed(self) -> None:
         """Check the state and proceed to work if there is data in the cashe."""
         if self.state.state.get('pkeys'):
-            logger.debug('Data to proceed %s', self.state.state.get('pkeys'))
+            logger.debug('Records to resolve %s', self.state.state.get('pkeys'))
             self.proccess(
                 self.state.state['table'],
                 self.state.state['pkeys'],
-                self.state.state['page_size'],
             )
+            self.set_state(table=None, pkeys=None, page_size=None)
+        if self.state.state.get('flushing'):
+            logger.debug('Movies to proceed %s', self.state.state.get('flushing'))
+        self.flush()
 
     def set_state(self, **kwargs) -> None:
         """Set State in cache.
@@ -58,42 +145,208 @@ class Enricher(object):
             kwargs: Key/value pair to save in cache.
 
         """
-        for key, value in kwargs.items():
-            self.state.set_state(key=key, value=value)
+        self.state.set_states(**kwargs)
+
+    def resolve(self, where_clause_table: str, pkeys: list) -> List[str]:
+        """Get ids of film works related to the records.
+
+        Args:
+            where_clause_table: Table name of the records.
+            pkeys: Primary keys of the records.
+
+        Returns:
+            List[str]: Film work ids.
+
+        """
+        if where_clause_table not in RELATIONS:
+            return list(pkeys)
+
+        link_table, link_column = RELATIONS[where_clause_table]
+        shard_filter = SQL('')
+        if self.shard_count > 1:
+            shard_filter = SQL(sql_templates.shard_filter).format(column=Identifier('film_work_id'))
+        query = SQL(sql_templates.get_film_work_ids).format(
+            link_table=Identifier('content', link_table),
+            link_column=Identifier(link_column),
+            shard_filter=shard_filter,
+        )
+        return [
+            record['film_work_id'] for record in self.pg.retry_fetchall(
+                query,
+                pkeys=list(pkeys),
+                shard_index=self.shard_index,
+                shard_count=self.shard_count,
+            )
+        ]
+
+    def person_films(self, pkey: str) -> Tuple[List[str], List[str]]:
+        """Get ids of film works of the person.
+
+        Args:
+            pkey: Primary key of the person.
+
+        Returns:
+            Tuple[List[str], List[str]]: Film work ids and ids of the film works directed by the person.
+
+        """
+        shard_filter = SQL('')
+        if self.shard_count > 1:
+            shard_filter = SQL(sql_templates.shard_filter).format(column=Identifier('film_work_id'))
+        records = self.pg.retry_fetchall(
+            SQL(sql_templates.get_person_film_works).format(shard_filter=shard_filter),
+            pkey=pkey,
+            shard_index=self.shard_index,
+            shard_count=self.shard_count,
+        )
+        return (
+            [record['film_work_id'] for record in records],
+            [record['film_work_id'] for record in records if record['directed']],
+        )
+
+    def rename(self, where_clause_table: str, pkeys: list) -> list:
+        """Replace changed names in the index in place.
+
+        Records without a cached name are new to the cache (or deleted), they
+        are enriched as usual. So are records failed to be renamed.
+
+        Args:
+            where_clause_table: Table name of the changed records.
+            pkeys: Primary keys of the changed records.
+
+        Returns:
+            list: Primary keys of the records to enrich.
+
+        """
+        names = self.names[where_clause_table]
+        query = SQL(sql_templates.get_names).format(
+            name_column=Identifier(NAMES[where_clause_table]),
+            table=Identifier('content', where_clause_table),
+        )
+        current = {record['id']: record['name'] for record in self.pg.retry_fetchall(query, pkeys=list(pkeys))}
+        to_enrich = []
+        for pkey in pkeys:
+            old_name = names.get_state(pkey)
+            name = current.get(pkey)
+            if old_name is None or name is None:
+                to_enrich.append(pkey)
+            elif old_name != name:
+                if where_clause_table == 'person':
+                    film_ids, directed = self.person_films(pkey)
+                else:
+                    film_ids, directed = self.resolve(where_clause_table, [pkey]), []
+                if not self.renamer(where_clause_table, film_ids, pkey, old_name, name, directed):
+                    to_enrich.append(pkey)
+        changed = {pkey: name for pkey, name in current.items() if names.get_state(pkey) != name}
+        if changed:
+            names.set_states(**changed)
+        logger.debug(
+            '%s of %s %s records are renamed in place', len(pkeys) - len(to_enrich), len(pkeys), where_clause_table,
+        )
+        return to_enrich
 
     def proccess(self, where_clause_table: str, pkeys: list) -> None:
-        """Run sql to enrich data and pass results to result_handler.
+        """Collect film work ids affected by changed records.
 
         Args:
-            where_clause_table: Table name for the SQL conditions using in WHERE clause.
-            pkeys: Primary keys for the SQL conditions.
+            where_clause_table: Table name of the changed records.
+            pkeys: Primary keys of the changed records.
 
         """
+        logger.debug('Resolve movies by %s', where_clause_table)
 
-        logger.debug('Select all movies data by %s', where_clause_table)
+        if where_clause_table in self.names:
+            pkeys = self.rename(where_clause_table, pkeys)
+            if not pkeys:
+                return
+        self.storage.add_members('film_ids', self.resolve(where_clause_table, pkeys))
 
-        query = SQL(sql_templates.get_movie_info_by_id).format(
-            where_clause_table=Identifier(where_clause_table),
+    def movies(self, film_ids: List[str], last_id: str = MIN_ID) -> Iterator[List[dict]]:
+        """Stream movies data by film work ids.
+
+        Args:
+            film_ids: Film work ids.
+            last_id: Film work id to continue after.
+
+        Returns:
+            Iterator[List[dict]]: Chunks of movies ordered by id.
+
+        """
+        return self.pg.stream(
+            SQL(self.query),
+            itersize=self.page_size,
+            film_ids=film_ids,
+            last_id=last_id,
         )
 
-        while query_result := self.pg.retry_fetchall(
-            query,
-            pkeys=tuple(pkeys),
-            last_id=self.state.get_state('last_processed_id') or '',
-            page_size=self.page_size,
-        ):
-            self.set_state(
-                table=where_clause_table,
-                pkeys=pkeys,
-                last_processed_id=query_result[-1]['id'],
-                page_size=self.page_size,
-            )
+    def enrich(self, film_ids: List[str]) -> None:
+        """Enrich movies without keeping the state and pass results to result_handler.
+
+        Args:
+            film_ids: Film work ids.
+
+        """
+        found = set()
+        for query_result in self.movies(film_ids):
             logger.debug('Got additional info for %s  movies', len(query_result))
+            found.update(movie['id'] for movie in query_result)
             self.result_handler(query_result)
+        deleted = [film_id for film_id in film_ids if film_id not in found]
+        if deleted:
+            self.result_handler([], deleted=deleted)
 
+    def complete(self) -> None:
+        """Reset the state of the finished flush."""
         self.set_state(
-            table=None,
-            pkeys=None,
+            flushing=None,
             last_processed_id=None,
-            page_size=None,
         )
+
+    def next_chunk(self, chunks: Iterator[List[dict]]) -> Optional[List[dict]]:
+        """Fetch the next chunk of movies and measure the time.
+
+        Args:
+            chunks: Chunks of movies.
+
+        Returns:
+            Optional[List[dict]]: Movies. None: there are no more movies.
+
+        """
+        with STAGE_LATENCY.labels('enrich').time():
+            return next(chunks, None)
+
+    def flush(self) -> None:
+        """Run sql to enrich collected movies and pass results to result_handler.
+
+        Movies collected while the flush runs are kept for the next flush.
+
+        """
+        film_ids = self.state.get_state('flushing')
+        if not film_ids:
+            film_ids = self.storage.members('film_ids')
+            if not film_ids:
+                return
+            self.set_state(flushing=film_ids, last_processed_id=None, cleared=('film_ids',))
+
+        logger.debug('Select movies data for %s movies', len(film_ids))
+
+        last_id = self.state.get_state('last_processed_id') or MIN_ID
+        chunks = self.movies(film_ids, last_id)
+        query_result = self.next_chunk(chunks)
+        if not query_result:
+            deleted = missing(film_ids, last_id, [])
+            if deleted:
+                self.result_handler([], on_done=self.complete, deleted=deleted)
+            else:
+                self.complete()
+        while query_result:
+            following = self.next_chunk(chunks)
+            if following:
+                on_done = partial(self.set_state, last_processed_id=query_result[-1]['id'])
+                deleted = missing(film_ids, last_id, query_result, query_result[-1]['id'])
+            else:
+                on_done = self.complete
+                deleted = missing(film_ids, last_id, query_result)
+            logger.debug('Got additional info for %s  movies', len(query_result))
+            self.result_handler(query_result, on_done=on_done, deleted=deleted)
+            last_id = query_result[-1]['id']
+            query_result = following
@@ -3,16 +3,24 @@
 import datetime
 import logging
 from logging.config import dictConfig
-from typing import Callable
+from time import monotonic
+from typing import Callable, Iterable, List, Optional, Tuple
 
 from lib.loggers import LOGGING
 from database.pg_database import PGConnection
 from lib import sql_templates, storage
+from lib.adaptive import AIMDSize
+from lib.metrics import STAGE_LATENCY
 from psycopg2.sql import SQL, Identifier
 
 dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
 
+MIN_ID = '00000000-0000-0000-0000-000000000000'
+MODIFIED_COLUMNS = {
+    'tombstone': 'deleted_at',
+}
+
 
 class Extractor(object):
     """Extract data from PostgreSQL database.
@@ -22,61 +30,171 @@ class Extractor(object):
         result_handler: Result of proccessing will return to the callable.
         storage: Permanent storage to keep state.
         state: State of the process
+        shard_index: Shard of film works to process.
+        shard_count: Count of shards.
+        page_sizer: Adaptive page size. None: the page size is fixed.
 
     """
 
-    def __init__(self, pg: PGConnection, redis_settings: dict, result_handler: Callable) -> None:
+    def __init__(
+        self,
+        pg: PGConnection,
+        redis_settings: dict,
+        result_handler: Callable,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        state_name: str = 'state',
+        page_sizer: Optional[AIMDSize] = None,
+    ) -> None:
         """Extractor class constructor.
 
         Args:
             pg: Used to work with PG Database.
             result_handler: Result of proccessing will return to the function.
             redis_settings: Redis connection settings.
+            shard_index: Shard of film works to process.
+            shard_count: Count of shards.
+            state_name: Name of the state in the storage.
+            page_sizer: Adaptive page size. None: the page size is fixed.
 
         """
         self.pg = pg
         self.result_handler = result_handler
-        self.storage = storage.RedisStorage(redis_settings)
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.storage = storage.RedisStorage(redis_settings, name=state_name)
         self.state = storage.State(self.storage)
+        self.page_sizer = page_sizer
+
+    def get_last_modified(self, table: str) -> Tuple[datetime.datetime, str]:
+        """Get the (modified, id) watermark from cache.
 
-    def get_last_modified(self, table: str) -> str:
-        """Get last id from cache.
+        Watermarks saved before the keyset cursor was introduced hold only the
+        modified date, they are resumed from the lowest id of that date.
 
         Args:
             table: Table name of the modified field.
 
         Returns:
-            str: ISO format date.
+            Tuple[datetime.datetime, str]: Last modified date and id.
+        """
+        watermark = self.state.get_state(table)
+        if isinstance(watermark, dict):
+            return watermark['modified'], watermark['id']
+        return watermark or datetime.date.min, MIN_ID
+
+    def lag(self, table: str) -> float:
+        """Compute time since the modified watermark of the table.
+
+        Args:
+            table: Table name of the watermark.
+
+        Returns:
+            float: Lag in seconds.
+
+        """
+        modified, _ = self.get_last_modified(table)
+        if not isinstance(modified, datetime.datetime):
+            modified = datetime.datetime.combine(modified, datetime.time.min)
+        if modified.tzinfo is None:
+            modified = modified.replace(tzinfo=datetime.timezone.utc)
+        return (datetime.datetime.now(datetime.timezone.utc) - modified).total_seconds()
+
+    def existing(self, tables: Iterable[str], schema: str = 'content') -> List[str]:
+        """Keep the tables created by the applied migrations.
+
+        Args:
+            tables: Table names.
+            schema: Database schema.
+
+        Returns:
+            List[str]: Names of the existing tables.
+
+        """
+        existing = []
+        for table in tables:
+            if self.pg.retry_fetchall(sql_templates.table_exists, table='{0}.{1}'.format(schema, table))[0]['exists']:
+                existing.append(table)
+            else:
+                logger.warning('Table %s.%s does not exist, apply the migrations to extract it', schema, table)
+        return existing
+
+    def skip_to_latest(self, table: str, schema: str = 'content') -> None:
+        """Move the watermark to the latest modified record.
+
+        Args:
+            table: Table name for the SQL query.
+            schema: Database schema.
+
         """
-        modified = self.state.get_state(table)
-        return modified or datetime.date.min
+        query = SQL(sql_templates.get_last_record).format(
+            table=Identifier(schema, table),
+            modified=Identifier(MODIFIED_COLUMNS.get(table, 'modified')),
+        )
+        query_result = self.pg.retry_fetchall(query)
+        if query_result:
+            self.state.set_state(
+                key=table,
+                value={
+                    'modified': query_result[-1]['modified'],
+                    'id': query_result[-1]['id'],
+                },
+            )
 
-    def proccess(self, table: str, schema: str = 'content', page_size: int = 100) -> None:
+    def proccess(self, table: str, schema: str = 'content', page_size: int = 100) -> bool:
         """Get modified data.
 
+        The watermark moves forward after result_handler keeps the page, a failure
+        in between repeats the page instead of losing it.
+
         Args:
             table: Table name for the SQL query.
             schema: Database schema.
-            page_size: Count of records.
+            page_size: Count of records. Ignored if the page size is adaptive.
+
+        Returns:
+            bool: The page is full, more modified records may follow.
 
         """
+        if self.page_sizer:
+            page_size = self.page_sizer.value
         logger.debug('Select modified from %s', table)
 
+        shard_filter = SQL('')
+        if table == 'film_work' and self.shard_count > 1:
+            shard_filter = SQL(sql_templates.shard_filter).format(column=Identifier('id'))
         query = SQL(sql_templates.get_modified_records).format(
             table=Identifier(schema, table),
+            modified=Identifier(MODIFIED_COLUMNS.get(table, 'modified')),
+            shard_filter=shard_filter,
         )
 
+        modified, last_id = self.get_last_modified(table)
+        started = monotonic()
         query_result = self.pg.retry_fetchall(
             query,
-            modified=self.get_last_modified(table),
+            modified=modified,
+            id=last_id,
             page_size=page_size,
+            shard_index=self.shard_index,
+            shard_count=self.shard_count,
         )
+        latency = monotonic() - started
+        STAGE_LATENCY.labels('extract').observe(latency)
+        if self.page_sizer and len(query_result) == page_size:
+            self.page_sizer.observe(latency)
 
         logger.debug('Got %s records from table %s', len(query_result), table)
         if query_result:
-            modified = query_result[-1]['modified']
-            self.state.set_state(key=table, value=modified)
             self.result_handler(
                 where_clause_table=table,
                 pkeys=[record['id'] for record in query_result],
             )
+            self.state.set_state(
+                key=table,
+                value={
+                    'modified': query_result[-1]['modified'],
+                    'id': query_result[-1]['id'],
+                },
+            )
+        return len(query_result) == page_size
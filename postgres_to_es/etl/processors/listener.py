@@ -0,0 +1,81 @@
+"""Wait for changes pushed by Postgres."""
+
+import logging
+from logging.config import dictConfig
+from time import monotonic
+from typing import Iterable, Optional, Set
+
+from lib.loggers import LOGGING
+from database.pg_database import PGConnection
+
+dictConfig(LOGGING)
+logger = logging.getLogger(__name__)
+
+
+class Listener(object):
+    """Collect notifications about changed tables.
+
+    Notifications only wake up the ETL, changed records are still selected by the
+    Extractor watermarks. After start and after every reconnect all the tables are
+    returned, so changes missed without a connection are scanned.
+
+    Attributes:
+        pg: Dedicated connection to listen to.
+        entities: Tables to scan after a reconnect.
+        window: Time in seconds to coalesce notifications after the first one.
+        max_size: Count of notifications to stop coalescing.
+        timeout: Max time in seconds to wait for the first notification.
+
+    """
+
+    def __init__(
+        self,
+        pg: PGConnection,
+        channel: str,
+        entities: Iterable[str],
+        window: float = 0.5,
+        max_size: int = 1000,
+        timeout: float = 60,
+    ) -> None:
+        """Listener class constructor.
+
+        Args:
+            pg: Dedicated connection to listen to.
+            channel: Name of the notification channel.
+            entities: Tables to scan after a reconnect.
+            window: Time in seconds to coalesce notifications after the first one.
+            max_size: Count of notifications to stop coalescing.
+            timeout: Max time in seconds to wait for the first notification.
+
+        """
+        self.pg = pg
+        self.entities = set(entities)
+        self.window = window
+        self.max_size = max_size
+        self.timeout = timeout
+        self.connects = 0
+        self.pg.listen(channel)
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        """Wait for notifications and coalesce them.
+
+        Args:
+            timeout: Max time in seconds to wait for the first notification. None: the default timeout.
+
+        Returns:
+            Set[str]: Names of the changed tables.
+
+        """
+        if self.connects != self.pg.connects:
+            logger.info('Scan all the tables after connecting')
+            self.connects = self.pg.connects
+            return set(self.entities)
+
+        notifies = self.pg.notifications(self.timeout if timeout is None else min(timeout, self.timeout))
+        deadline = monotonic() + self.window
+        while notifies and len(notifies) < self.max_size and monotonic() < deadline:
+            notifies.extend(self.pg.notifications(deadline - monotonic()))
+
+        tables = {notify.payload for notify in notifies} & self.entities
+        logger.debug('Got %s notifications about %s', len(notifies), tables)
+        return tables
@@ -2,29 +2,124 @@
 
 import logging
 from datetime import datetime
+from decimal import Decimal
 from logging.config import dictConfig
-from typing import List
+from multiprocessing.pool import ThreadPool
+from time import monotonic, sleep
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
 
+import orjson
 from lib.loggers import LOGGING
-from database.backoff_connection import backoff
-from elasticsearch import Elasticsearch, helpers
+from database.backoff_connection import DEADLINES, backoff
+from elasticsearch import Elasticsearch
 from lib import storage
+from lib.adaptive import AIMDSize
+from lib.content_cache import ContentHashCache
+from lib.metrics import BULK_ERRORS, DOCUMENTS, DOCUMENTS_DELETED, DOCUMENTS_SKIPPED, STAGE_LATENCY
 
 dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
 
+BulkAction = Tuple[str, bytes]
+
+OVERLOAD_STATUSES = frozenset((429, 503))
+
+RENAME_CHUNK_SIZE = 10000
+RENAME_SCRIPTS = {
+    'genre': """
+        for (int i = 0; i < ctx._source.genre.size(); i++) {
+            if (ctx._source.genre[i] == params.old_name) { ctx._source.genre[i] = params.name; }
+        }
+    """,
+    'person': """
+        for (String role : ['actors', 'writers']) {
+            def names = new ArrayList();
+            for (def person : ctx._source[role]) {
+                if (person.id == params.id) { person.name = params.name; }
+                names.add(person.name);
+            }
+            ctx._source[role + '_names'] = names;
+        }
+        if (params.directed.containsKey(ctx._id)) {
+            for (int i = 0; i < ctx._source.director.size(); i++) {
+                if (ctx._source.director[i] == params.old_name) { ctx._source.director[i] = params.name; }
+            }
+        }
+    """,
+}
+
+
+def encode_default(value: Any) -> Any:
+    """Encode types unknown to orjson.
+
+    Args:
+        value: Value to encode.
+
+    Returns:
+        Any: Encodable value.
+
+    Raises:
+        TypeError: The type is not supported.
+
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError('Unable to encode {0!r}'.format(value))
+
+
+def succeeded(item: dict) -> bool:
+    """Check the result of a bulk action, deleting a missing document is not an error.
+
+    Args:
+        item: Result of the action.
+
+    Returns:
+        bool: The action succeeded.
+
+    """
+    (action, details), = item.items()
+    return 200 <= details['status'] < 300 or (action == 'delete' and details['status'] == 404)
+
+
+def versioned_index(index: str, version: int) -> str:
+    """Name of the physical index behind the alias.
+
+    Args:
+        index: Name of the alias.
+        version: Version of the index.
+
+    Returns:
+        str: Name of the physical index.
+
+    """
+    return '{0}_v{1}'.format(index, version)
+
 
 class ESLoader(object):
     """Load data to Elastic Search.
 
     Attributes:
         client: Elisticsearch client.
-        storage: Permanent storage to keep state.
+        bulk_options: Bulk mode, chunking and retry parameters.
+        storage: Permanent storage to keep failed actions.
         state: State of the process
+        cache: Content hashes of the loaded documents. None: every document is loaded.
+        chunk_sizer: Adaptive count of actions in one bulk request. None: the chunk size is fixed.
 
     """
 
-    def __init__(self, redis_settings: dict, transport_options: dict, index: str, index_schema: dict = None) -> None:
+    def __init__(
+        self,
+        redis_settings: dict,
+        transport_options: dict,
+        index: str,
+        index_schema: dict = None,
+        bulk_options: dict = None,
+        state_name: str = 'state',
+        version: Optional[int] = None,
+        hash_cache_size: int = 0,
+        chunk_sizer: Optional[AIMDSize] = None,
+    ) -> None:
         """ESLoader class constructor.
 
         Args:
@@ -32,70 +127,392 @@ class ESLoader(object):
             index: Name of the Elasticsearch index.
             index_schema: Schema of the index. Not None: the index creates.
             redis_settings: Redis connection settings.
+            bulk_options: Bulk mode, chunking and retry parameters.
+            state_name: Name of the state in the storage.
+            version: Version of the physical index behind the index alias. None: the index is not versioned.
+            hash_cache_size: Size of the local LRU of the content hashes. 0: the cache is disabled.
+            chunk_sizer: Adaptive count of actions in one bulk request. None: the chunk size is fixed.
 
         """
         self.client = Elasticsearch(**transport_options)
-        self.storage = storage.RedisStorage(redis_settings)
+        self.bulk_options = bulk_options or {'mode': 'streaming', 'max_retries': 0}
+        self.storage = storage.RedisStorage(redis_settings, name=state_name)
         self.state = storage.State(self.storage)
         self.index = index
+        self.index_schema = index_schema
+        self.chunk_sizer = chunk_sizer
+        self.cache = None
+        if hash_cache_size:
+            self.cache = ContentHashCache(
+                storage.RedisStorage(redis_settings, name='hashes:{0}'.format(index)),
+                size=hash_cache_size,
+            )
+
+        if index_schema and self.create_index(index=index, index_schema=index_schema, version=version) and self.cache:
+            self.cache.clear()
+
+    def serialize(self, document: dict) -> BulkAction:
+        """Serialize the document to NDJSON lines of the bulk index action.
+
+        Args:
+            document: Document to index.
+
+        Returns:
+            BulkAction: Id of the document and the action lines.
+
+        """
+        return self.serialize_raw(document['id'], orjson.dumps(document, default=encode_default))
+
+    def serialize_raw(self, doc_id: str, document: bytes) -> BulkAction:
+        """Make NDJSON lines of the bulk index action for the JSON document.
 
-        if index_schema:
-            self.create_index(index=index, index_schema=index_schema)
-        self.proceed()
+        Args:
+            doc_id: Id of the document.
+            document: Document serialized to JSON.
+
+        Returns:
+            BulkAction: Id of the document and the action lines.
 
-    def proceed(self):
-        """Check the state and proceed to work if there is data in the cache."""
-        if self.state.state.get('data'):
-            logger.debug('Data to proceed %s', self.state.state.get('data'))
-            self.proccess(self.state.state['data'])
+        """
+        action = {'index': {'_index': self.index, '_id': doc_id}}
+        return doc_id, b''.join((orjson.dumps(action), b'\n', document, b'\n'))
 
-    def convert_to_bulk_format(self, data: dict) -> dict:
-        """Convert to bulk format.
+    def serialize_delete(self, doc_id: str) -> BulkAction:
+        """Make the NDJSON line of the bulk delete action.
 
         Args:
-            data: Converting dictionary.
+            doc_id: Id of the document.
 
         Returns:
-            dict: Converted dictionary.
+            BulkAction: Id of the document and the action line.
 
         """
-        data['_index'] = self.index
-        if id := data.get('id'):
-            data['_id'] = id
-        return data
+        return doc_id, b''.join((orjson.dumps({'delete': {'_index': self.index, '_id': doc_id}}), b'\n'))
 
-    def proccess(self, data: dict) -> None:
+    def proccess(self, data: dict, on_done: Optional[Callable] = None, deleted: Iterable[str] = ()) -> None:
         """Load data to Elasticsearch.
 
         Args:
             data: Loading data.
+            on_done: Callback to acknowledge the loaded data to the upstream processors.
+            deleted: Ids of the documents to delete.
+
+        """
+        self.load([self.serialize(document) for document in data], on_done, deleted)
+
+    def proccess_raw(
+        self, data: List[Tuple[str, bytes]], on_done: Optional[Callable] = None, deleted: Iterable[str] = (),
+    ) -> None:
+        """Load documents serialized to JSON already.
+
+        Args:
+            data: Pairs of the document id and the JSON document.
+            on_done: Callback to acknowledge the loaded data to the upstream processors.
+            deleted: Ids of the documents to delete.
+
+        """
+        self.load([self.serialize_raw(doc_id, document) for doc_id, document in data], on_done, deleted)
+
+    def load(self, actions: List[BulkAction], on_done: Optional[Callable], deleted: Iterable[str]) -> None:
+        """Load serialized documents, skip the unchanged ones and delete the deleted ones.
+
+        Args:
+            actions: Serialized bulk index actions.
+            on_done: Callback to acknowledge the loaded data to the upstream processors.
+            deleted: Ids of the documents to delete.
+
+        """
+        count = len(actions)
+        deletes = [self.serialize_delete(doc_id) for doc_id in deleted]
+        if self.cache is None:
+            errors = self.bulk(actions + deletes)
+        else:
+            actions, digests = self.cache.changed(actions)
+            DOCUMENTS_SKIPPED.inc(count - len(actions))
+            self.cache.forget([doc_id for doc_id, _ in deletes])
+            errors = self.bulk(actions + deletes)
+            failed = {next(iter(item.values())).get('_id') for item in errors}
+            self.cache.remember({doc_id: digest for doc_id, digest in digests.items() if doc_id not in failed})
+            logger.info(
+                '%s of %s documents are changed, skip rate %.2f',
+                len(actions), count, self.cache.skip_rate,
+            )
+        delete_errors = sum('delete' in item for item in errors)
+        DOCUMENTS.inc(len(actions) - len(errors) + delete_errors)
+        DOCUMENTS_DELETED.inc(len(deletes) - delete_errors)
+        if deletes:
+            logger.info('%s documents are deleted', len(deletes) - delete_errors)
+        if on_done:
+            on_done()
+
+    @backoff(dependency='elasticsearch', deadline=DEADLINES['elasticsearch'])
+    def refresh(self) -> None:
+        """Make the indexed documents visible to the search and update by query."""
+        self.client.indices.refresh(index=self.index)
+
+    @backoff(dependency='elasticsearch', deadline=DEADLINES['elasticsearch'])
+    def update_by_query(self, body: dict) -> dict:
+        """Update the documents matching the query with the script.
+
+        Args:
+            body: Query and script of the request.
+
+        Returns:
+            dict: Response of Elasticsearch.
 
         """
-        self.state.set_state(key='data', value=data)
-        self.bulk(list(map(self.convert_to_bulk_format, data)))
-        self.state.set_state(key='data', value=None)
+        return self.client.update_by_query(
+            index=self.index, body=body, conflicts='proceed', slices='auto', request_timeout=3600,
+        )
+
+    def rename(
+        self,
+        table: str,
+        film_ids: List[str],
+        pkey: str,
+        old_name: str,
+        name: str,
+        directed: Iterable[str] = (),
+    ) -> bool:
+        """Replace the name of a genre or a person in the indexed movies.
 
-    @backoff()
-    def create_index(self, index: str, index_schema: dict) -> None:
-        """Create index if the index doesn't exists.
+        Only the names are changed, the movies are not loaded again. The index
+        is refreshed first, so the update sees the movies bulk indexed just before.
+        A version conflict leaves the movie with the old name, so the rename fails
+        and the movies are enriched again.
 
         Args:
-            index: Name of the index.
+            table: Table of the renamed record, genre or person.
+            film_ids: Ids of the movies of the record.
+            pkey: Primary key of the record.
+            old_name: Name in the index.
+            name: New name.
+            directed: Ids of the movies directed by the person.
+
+        Returns:
+            bool: All the movies are updated, without failures and version conflicts.
+
+        """
+        directed = set(directed)
+        updated, conflicts, failures = 0, 0, []
+        self.refresh()
+        for start in range(0, len(film_ids), RENAME_CHUNK_SIZE):
+            chunk = film_ids[start:start + RENAME_CHUNK_SIZE]
+            if self.cache:
+                self.cache.forget(chunk)
+            response = self.update_by_query({
+                'query': {'ids': {'values': chunk}},
+                'script': {
+                    'source': RENAME_SCRIPTS[table],
+                    'lang': 'painless',
+                    'params': {
+                        'id': pkey,
+                        'old_name': old_name,
+                        'name': name,
+                        'directed': {film_id: True for film_id in chunk if film_id in directed},
+                    },
+                },
+            })
+            updated += response.get('updated', 0)
+            conflicts += response.get('version_conflicts', 0)
+            failures.extend(response.get('failures', []))
+        if failures:
+            logger.error('Error to rename %s %s: %s', table, pkey, failures)
+        if conflicts:
+            logger.warning('%s %s is not renamed in %s movies with version conflicts', table, pkey, conflicts)
+        logger.info('%s %s is renamed in %s of %s movies', table, pkey, updated, len(film_ids))
+        DOCUMENTS.inc(updated)
+        return not failures and not conflicts
+
+    @backoff(dependency='elasticsearch')
+    def create_index(self, index: str, index_schema: dict, version: Optional[int] = None) -> bool:
+        """Create index if the index or the alias doesn't exists.
+
+        Args:
+            index: Name of the index or the alias.
             index_schema: Schema of the index.
+            version: Version of the physical index created behind the alias.
+
+        Returns:
+            bool: The index is created.
 
         """
-        if not self.client.indices.exists(index=index):
+        if self.client.indices.exists(index=index):
+            return False
+        if version is None:
             self.client.indices.create(index=index, body=index_schema)
+        else:
+            self.client.indices.create(
+                index=versioned_index(index, version),
+                body={**index_schema, 'aliases': {index: {}}},
+            )
+        return True
+
+    @backoff(dependency='elasticsearch')
+    def alias_targets(self, alias: str) -> List[str]:
+        """Get the indices the alias points to.
+
+        Args:
+            alias: Name of the alias.
 
-    @backoff()
-    def bulk(self, data: List[dict]) -> None:
+        Returns:
+            List[str]: Names of the indices, an index named as the alias is returned as is.
+
+        """
+        if self.client.indices.exists_alias(name=alias):
+            return list(self.client.indices.get_alias(name=alias))
+        if self.client.indices.exists(index=alias):
+            return [alias]
+        return []
+
+    @backoff(dependency='elasticsearch')
+    def swap_alias(self, alias: str) -> None:
+        """Point the alias to the index and remove the indices it pointed to.
+
+        All the actions are applied atomically, searches never see a missing or a partial index.
+        An index named as the alias (created before the versioning) is replaced too.
+
+        Args:
+            alias: Name of the alias.
+
+        """
+        actions = [{'add': {'index': self.index, 'alias': alias}}]
+        old_indices = [index for index in self.alias_targets(alias) if index != self.index]
+        actions.extend({'remove_index': {'index': index}} for index in old_indices)
+        self.client.indices.update_aliases(body={'actions': actions})
+        logger.info('Alias %s is swapped to %s, removed: %s', alias, self.index, old_indices)
+
+    @backoff(dependency='elasticsearch')
+    def put_settings(self, index_settings: dict) -> None:
+        """Update dynamic settings of the index.
+
+        Args:
+            index_settings: Index settings to update.
+
+        """
+        self.client.indices.put_settings(index=self.index, body={'index': index_settings})
+
+    def start_bulk_load(self) -> None:
+        """Disable refreshes and replicas while the index is loaded."""
+        self.put_settings({'refresh_interval': '-1', 'number_of_replicas': 0})
+
+    @backoff(dependency='elasticsearch')
+    def finish_bulk_load(self) -> None:
+        """Restore index settings from the schema and merge the loaded segments."""
+        index_settings = self.index_schema.get('settings', {}) if self.index_schema else {}
+        self.put_settings({
+            'refresh_interval': index_settings.get('refresh_interval', '1s'),
+            'number_of_replicas': index_settings.get('number_of_replicas', 1),
+        })
+        self.client.indices.refresh(index=self.index)
+        self.client.indices.forcemerge(index=self.index, max_num_segments=1, request_timeout=3600)
+
+    def chunks(self, actions: List[BulkAction]) -> Iterator[List[BulkAction]]:
+        """Split actions into chunks limited by count and size in bytes.
+
+        Args:
+            actions: Serialized bulk actions.
+
+        Yields:
+            List[BulkAction]: Chunk of actions.
+
+        """
+        chunk_size = self.chunk_sizer.value if self.chunk_sizer else self.bulk_options.get('chunk_size', 500)
+        max_chunk_bytes = self.bulk_options.get('max_chunk_bytes', 100 * 1024 * 1024)
+        chunk, size = [], 0
+        for action in actions:
+            if chunk and (len(chunk) == chunk_size or size + len(action[1]) > max_chunk_bytes):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(action)
+            size += len(action[1])
+        if chunk:
+            yield chunk
+
+    def send_chunk(self, chunk: List[BulkAction]) -> List[dict]:
+        """Send one bulk request with the raw NDJSON body.
+
+        Args:
+            chunk: Chunk of serialized actions.
+
+        Returns:
+            List[dict]: Results of failed actions.
+
+        """
+        started = monotonic()
+        try:
+            response = self.client.bulk(body=b''.join(lines for _, lines in chunk))
+        except Exception:
+            if self.chunk_sizer:
+                self.chunk_sizer.observe(monotonic() - started, error_rate=1)
+            raise
+        STAGE_LATENCY.labels('bulk').observe(monotonic() - started)
+        failed = []
+        if response['errors']:
+            failed = [item for item in response['items'] if not succeeded(item)]
+        if self.chunk_sizer:
+            overloaded = [item for item in failed if next(iter(item.values()))['status'] in OVERLOAD_STATUSES]
+            # Short chunks are fast anyway, they say nothing about a bigger size.
+            if overloaded or len(chunk) >= self.chunk_sizer.value:
+                self.chunk_sizer.observe(monotonic() - started, error_rate=len(overloaded) / len(chunk))
+        return failed
+
+    def bulk_results(self, actions: List[BulkAction]) -> Iterator[dict]:
+        """Send actions in chunks one by one or in parallel threads.
+
+        Args:
+            actions: Serialized bulk actions.
+
+        Yields:
+            dict: Result of every failed action.
+
+        """
+        if self.bulk_options.get('mode') == 'parallel':
+            with ThreadPool(self.bulk_options.get('thread_count', 4)) as pool:
+                for failed in pool.imap(self.send_chunk, self.chunks(actions)):
+                    yield from failed
+        else:
+            for chunk in self.chunks(actions):
+                yield from self.send_chunk(chunk)
+
+    @backoff(dependency='elasticsearch', deadline=DEADLINES['elasticsearch'])
+    def bulk(self, data: List[BulkAction]) -> List[dict]:
         """Bulk data to ES with backoff implementation.
 
+        Actions rejected with 429 status are sent again with exponential delay.
+
         Args:
-            data: Loading data.
+            data: Serialized bulk actions.
+
+        Returns:
+            List[dict]: Results of failed actions.
 
         """
-        _, errors = helpers.bulk(self.client, data, stats_only=False)
+        errors = []
+        actions = data
+        for retry in range(self.bulk_options.get('max_retries', 0) + 1):
+            if retry:
+                delay = min(
+                    self.bulk_options['initial_backoff'] * 2 ** (retry - 1),
+                    self.bulk_options['max_backoff'],
+                )
+                logger.warning('%s actions are rejected. Next try in %s seconds', len(actions), delay)
+                sleep(delay)
+            by_id = dict(actions)
+            actions = []
+            for item in self.bulk_results(list(by_id.items())):
+                details = next(iter(item.values()))
+                if details.get('status') == 429 and details.get('_id') in by_id:
+                    actions.append((details['_id'], by_id[details['_id']]))
+                else:
+                    errors.append(item)
+            if not actions:
+                break
+        else:
+            errors.extend({'index': {'_id': doc_id, 'status': 429}} for doc_id, _ in actions)
+
+        for item in errors:
+            BULK_ERRORS.labels(next(iter(item.values())).get('status')).inc()
         if errors:
             failed = self.state.get_state('failed') or []
             failed.append(
@@ -106,3 +523,4 @@ class ESLoader(object):
             )
             self.state.set_state(key='failed', value=failed)
             logger.error('Error to bulk data %s', errors)
+        return errors
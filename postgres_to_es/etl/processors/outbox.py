@@ -0,0 +1,84 @@
+"""Consume changed movies from the outbox table."""
+
+import logging
+from logging.config import dictConfig
+from typing import Callable
+
+from lib.loggers import LOGGING
+from database.backoff_connection import DEADLINES, backoff_reconnect
+from database.pg_database import PGConnection
+from lib import sql_templates
+from processors.enricher import Enricher
+from psycopg2.extras import RealDictCursor
+
+dictConfig(LOGGING)
+logger = logging.getLogger(__name__)
+
+
+class OutboxConsumer(object):
+    """Claim changed film work ids from the outbox and index them.
+
+    Rows are claimed with FOR UPDATE SKIP LOCKED and deleted in the same transaction
+    after the movies are loaded, so any count of consumers can run together and
+    a failed consumer leaves its rows to the others. The consumer installs the
+    missing outbox triggers on start, installed triggers are left as they are, so
+    the tables are not locked on every start. content.disable_search_outbox()
+    removes them and the rows left when the outbox mode is turned off.
+
+    Attributes:
+        pg: Writable connection without autocommit.
+        enricher: Used to fetch movies and pass them down the chain.
+        drain: Waits until the loaded movies leave the pipeline.
+        page_size: Count of outbox rows to claim.
+
+    """
+
+    def __init__(self, pg: PGConnection, enricher: Enricher, drain: Callable, page_size: int = 100) -> None:
+        """OutboxConsumer class constructor.
+
+        Args:
+            pg: Writable connection without autocommit.
+            enricher: Used to fetch movies and pass them down the chain.
+            drain: Waits until the loaded movies leave the pipeline.
+            page_size: Count of outbox rows to claim.
+
+        """
+        self.pg = pg
+        self.enricher = enricher
+        self.drain = drain
+        self.page_size = page_size
+        self.enable()
+
+    def _connect(self) -> None:
+        """Reconnect the outbox connection."""
+        self.pg._connect()
+
+    @backoff_reconnect(dependency='postgres')
+    def enable(self) -> None:
+        """Install the missing triggers filling the outbox, changes made before are not in the outbox."""
+        with self.pg.connection:
+            with self.pg.connection.cursor() as cursor:
+                cursor.execute(sql_templates.enable_outbox)
+        logger.info('Outbox triggers are enabled')
+
+    @backoff_reconnect(dependency='postgres', deadline=DEADLINES['postgres'])
+    def proccess(self) -> int:
+        """Index one claimed page of the outbox.
+
+        Returns:
+            int: Count of claimed rows.
+
+        """
+        with self.pg.connection:
+            with self.pg.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(sql_templates.claim_outbox, {'page_size': self.page_size})
+                claimed = cursor.fetchall()
+                if not claimed:
+                    return 0
+
+                film_ids = sorted({record['film_work_id'] for record in claimed})
+                logger.debug('Claimed %s outbox rows for %s movies', len(claimed), len(film_ids))
+                self.enricher.enrich(film_ids)
+                self.drain()
+                cursor.execute(sql_templates.delete_outbox, {'ids': [record['id'] for record in claimed]})
+        return len(claimed)
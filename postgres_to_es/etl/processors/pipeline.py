@@ -0,0 +1,128 @@
+"""Pipelined mode of the ETL processors."""
+
+import logging
+from logging.config import dictConfig
+from queue import Full, Queue
+from threading import Thread
+from time import sleep
+from typing import Callable
+
+from lib.loggers import LOGGING
+
+dictConfig(LOGGING)
+logger = logging.getLogger(__name__)
+
+
+class Stage(Thread):
+    """Run a processor in a worker thread fed by a bounded queue.
+
+    Putting into a full queue blocks, so a slow stage holds back the stages before it.
+
+    Attributes:
+        handler: Processor method to call for every item.
+        queue: Items waiting for the handler.
+
+    """
+
+    def __init__(self, handler: Callable, depth: int = 1) -> None:
+        """Stage class constructor.
+
+        Args:
+            handler: Processor method to call for every item.
+            depth: Max count of items waiting in the queue.
+
+        """
+        super().__init__(name=getattr(handler, '__qualname__', None), daemon=True)
+        self.handler = handler
+        self.queue = Queue(maxsize=depth)
+
+    def put(self, *args, **kwargs) -> None:
+        """Pass the arguments to the handler in the worker thread.
+
+        Args:
+            args: Args for the handler.
+            kwargs: Kwargs for the handler.
+
+        Raises:
+            RuntimeError: The worker thread is stopped.
+
+        """
+        while self.is_alive():
+            try:
+                self.queue.put((args, kwargs), timeout=1)
+            except Full:
+                continue
+            return
+        raise RuntimeError('Stage {0} is stopped'.format(self.name))
+
+    def drain(self) -> None:
+        """Wait until all the items are handled.
+
+        Raises:
+            RuntimeError: The worker thread is stopped.
+
+        """
+        while self.queue.unfinished_tasks:
+            if not self.is_alive():
+                raise RuntimeError('Stage {0} is stopped'.format(self.name))
+            sleep(0.1)
+
+    def run(self) -> None:
+        """Handle items from the queue until the handler fails."""
+        logger.debug('Stage %s started', self.name)
+        while True:
+            args, kwargs = self.queue.get()
+            try:
+                self.handler(*args, **kwargs)
+            except Exception:
+                logger.exception('Stage %s is stopped', self.name)
+                return
+            finally:
+                self.queue.task_done()
+
+
+class Pipeline(object):
+    """Connect processors through worker threads in pipelined mode.
+
+    Attributes:
+        enabled: Run the processors in worker threads.
+        depth: Max count of items waiting for every stage.
+        stages: Started stages from upstream to downstream.
+
+    """
+
+    def __init__(self, enabled: bool = False, depth: int = 1) -> None:
+        """Pipeline class constructor.
+
+        Args:
+            enabled: Run the processors in worker threads.
+            depth: Max count of items waiting for every stage.
+
+        """
+        self.enabled = enabled
+        self.depth = depth
+        self.stages = []
+
+    def stage(self, handler: Callable) -> Callable:
+        """Wrap the processor method to use it as a result_handler.
+
+        Stages have to be created from downstream to upstream.
+
+        Args:
+            handler: Processor method.
+
+        Returns:
+            Callable: The handler itself or a put method of the started stage.
+
+        """
+        if not self.enabled:
+            return handler
+        stage = Stage(handler=handler, depth=self.depth)
+        stage.start()
+        self.stages.insert(0, stage)
+        return stage.put
+
+    def drain(self) -> None:
+        """Wait until every stage handles all the items."""
+        for stage in self.stages:
+            stage.drain()
@@ -0,0 +1,150 @@
+"""Full reindex process."""
+
+import logging
+from logging.config import dictConfig
+from typing import Iterable, Optional
+
+from lib.loggers import LOGGING
+from database.backoff_connection import backoff_reconnect
+from database.pg_database import PGConnection
+from lib import sql_templates
+from lib.metrics import DOCUMENTS
+from processors.enricher import Enricher
+from processors.extractor import Extractor
+from processors.loader import ESLoader
+
+dictConfig(LOGGING)
+logger = logging.getLogger(__name__)
+
+COPY_DELIMITER = b'\x02'
+
+
+class FullReindexer(object):
+    """Load all the movies with one COPY query.
+
+    Postgres builds the documents, the COPY output is passed to ES bulk without parsing.
+    Extractor watermarks are moved to the latest records before the COPY starts,
+    then the changes made during the load are extracted until the index catches up.
+    With an alias the new index replaces the live one atomically when it is caught up.
+
+    Attributes:
+        pg: Used to work with PG Database.
+        extractor: Extractor of the changes to catch up.
+        enricher: Enricher fed by the extractor.
+        loader: Loader of the documents.
+        entities: Tables of the extractor watermarks.
+        page_size: Count of documents in one bulk.
+        alias: Alias to swap to the loaded index. None: the index is loaded in place.
+
+    """
+
+    def __init__(
+        self,
+        pg: PGConnection,
+        extractor: Extractor,
+        enricher: Enricher,
+        loader: ESLoader,
+        entities: Iterable[str],
+        page_size: int = 1000,
+        alias: Optional[str] = None,
+    ) -> None:
+        """FullReindexer class constructor.
+
+        Args:
+            pg: Used to work with PG Database.
+            extractor: Extractor of the changes to catch up.
+            enricher: Enricher fed by the extractor.
+            loader: Loader of the documents.
+            entities: Tables of the extractor watermarks.
+            page_size: Count of documents in one bulk.
+            alias: Alias to swap to the loaded index. None: the index is loaded in place.
+
+        """
+        self.pg = pg
+        self.extractor = extractor
+        self.enricher = enricher
+        self.loader = loader
+        self.entities = entities
+        self.page_size = page_size
+        self.alias = alias
+        self.tail = b''
+        self.actions = []
+        self.count = 0
+
+    def write(self, data: bytes) -> None:
+        """Receive the COPY output and bulk complete pages.
+
+        Args:
+            data: Part of the COPY output.
+
+        """
+        lines = (self.tail + data).split(b'\n')
+        self.tail = lines.pop()
+        for line in lines:
+            doc_id, document = line.split(COPY_DELIMITER, 1)
+            self.actions.append(self.loader.serialize_raw(doc_id.decode('utf-8'), document))
+        if len(self.actions) >= self.page_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Bulk collected documents."""
+        if self.actions:
+            errors = self.loader.bulk(self.actions)
+            DOCUMENTS.inc(len(self.actions) - len(errors))
+            self.count += len(self.actions)
+            logger.info('Loaded %s movies', self.count)
+            self.actions = []
+
+    def _connect(self) -> None:
+        """Reconnect to the DB to copy again."""
+        self.pg._connect()
+
+    @backoff_reconnect(dependency='postgres')
+    def load(self) -> None:
+        """Copy all the movies from the beginning."""
+        self.tail, self.actions, self.count = b'', [], 0
+        self.pg.copy_to(sql_templates.copy_movie_documents, self)
+        self.flush()
+
+    def catch_up(self) -> None:
+        """Extract the changes until all the tables are read to the end."""
+        tables = set(self.entities)
+        while tables:
+            unfinished = set()
+            for table in tables:
+                if self.extractor.proccess(table, page_size=self.page_size):
+                    unfinished.add(table)
+            self.enricher.flush()
+            tables = unfinished
+
+    def proccess(self) -> None:
+        """Reload all the movies to the index.
+
+        Raises:
+            RuntimeError: The alias already points to the index, bulk load settings would hit the live index.
+
+        """
+        if self.alias and self.loader.index in self.loader.alias_targets(self.alias):
+            raise RuntimeError(
+                'Index {0} is live behind the alias {1}, reindex into a new version'.format(
+                    self.loader.index, self.alias,
+                ),
+            )
+
+        for entity in self.entities:
+            self.extractor.skip_to_latest(entity)
+
+        self.loader.start_bulk_load()
+        try:
+            self.load()
+        finally:
+            self.loader.finish_bulk_load()
+        logger.info('Full reindex is finished, %s movies loaded', self.count)
+
+        self.catch_up()
+        if self.alias:
+            self.loader.swap_alias(self.alias)
+            # Changes made between the catch up and the swap went to the old index only.
+            self.catch_up()
+        # The finished reindex does not hold back the tombstone pruning.
+        self.extractor.state.set_states(**{entity: None for entity in self.entities})
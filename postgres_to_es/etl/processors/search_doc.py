@@ -0,0 +1,110 @@
+"""Read movie documents maintained by the database."""
+
+import logging
+from functools import partial
+from logging.config import dictConfig
+from time import monotonic
+
+from lib.loggers import LOGGING
+from database.backoff_connection import backoff_reconnect
+from lib import sql_templates
+from lib.metrics import STAGE_LATENCY
+from processors.extractor import Extractor
+from psycopg2.sql import SQL, Identifier
+
+dictConfig(LOGGING)
+logger = logging.getLogger(__name__)
+
+SEARCH_DOC_TABLE = 'movie_search_doc'
+
+
+class SearchDocReader(Extractor):
+    """Read ready documents from content.movie_search_doc.
+
+    Database triggers keep a document of every movie in the table, so the
+    changes are read with one range scan by (modified, id) without enrichment.
+    Rows without a document are deleted movies. The watermark moves forward
+    only when result_handler acknowledges the page. The reader installs the
+    missing triggers on start, so its connection must be writable.
+    content.disable_movie_search_doc() removes them and the documents when the
+    search document mode is turned off.
+
+    Attributes:
+        cursor: The (modified, id) watermark of the last read page.
+
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        """SearchDocReader class constructor.
+
+        Args:
+            args: Args of the Extractor.
+            kwargs: Kwargs of the Extractor.
+
+        """
+        super().__init__(*args, **kwargs)
+        self.enable()
+        self.cursor = self.get_last_modified(SEARCH_DOC_TABLE)
+
+    def _connect(self) -> None:
+        """Reconnect the writable connection."""
+        self.pg._connect()
+
+    @backoff_reconnect(dependency='postgres')
+    def enable(self) -> None:
+        """Install the missing triggers maintaining the documents, fill the documents after the install."""
+        with self.pg.connection.cursor() as cursor:
+            cursor.execute(sql_templates.enable_search_doc)
+            if cursor.fetchone()[0]:
+                logger.info('Search document triggers are installed, the documents are filled')
+
+    def proccess(self, table: str = SEARCH_DOC_TABLE, schema: str = 'content', page_size: int = 100) -> bool:
+        """Pass the next page of the changed documents to result_handler.
+
+        Args:
+            table: Table name of the documents.
+            schema: Database schema.
+            page_size: Count of records. Ignored if the page size is adaptive.
+
+        Returns:
+            bool: The page is full, more changed documents may follow.
+
+        """
+        if self.page_sizer:
+            page_size = self.page_sizer.value
+        shard_filter = SQL('')
+        if self.shard_count > 1:
+            shard_filter = SQL(sql_templates.shard_filter).format(column=Identifier('id'))
+        modified, last_id = self.cursor
+        started = monotonic()
+        query_result = self.pg.retry_fetchall(
+            SQL(sql_templates.get_search_docs).format(
+                table=Identifier(schema, table),
+                shard_filter=shard_filter,
+            ),
+            modified=modified,
+            id=last_id,
+            page_size=page_size,
+            shard_index=self.shard_index,
+            shard_count=self.shard_count,
+        )
+        latency = monotonic() - started
+        STAGE_LATENCY.labels('extract').observe(latency)
+        if self.page_sizer and len(query_result) == page_size:
+            self.page_sizer.observe(latency)
+        logger.debug('Got %s documents', len(query_result))
+        if query_result:
+            self.cursor = query_result[-1]['modified'], query_result[-1]['id']
+            self.result_handler(
+                [
+                    (record['id'], record['document'].encode('utf-8'))
+                    for record in query_result if record['document'] is not None
+                ],
+                on_done=partial(
+                    self.state.set_state,
+                    key=table,
+                    value={'modified': self.cursor[0], 'id': self.cursor[1]},
+                ),
+                deleted=[record['id'] for record in query_result if record['document'] is None],
+            )
+        return len(query_result) == page_size
@@ -0,0 +1,114 @@
+"""Prune tombstones of deleted records."""
+
+import datetime
+import logging
+from logging.config import dictConfig
+from time import monotonic
+from typing import Iterable, Optional
+
+from lib.loggers import LOGGING
+from database.backoff_connection import DEADLINES, backoff_reconnect
+from database.pg_database import PGConnection
+from lib import sql_templates, storage
+
+dictConfig(LOGGING)
+logger = logging.getLogger(__name__)
+
+TOMBSTONE_TABLE = 'tombstone'
+
+
+class TombstonePruner(object):
+    """Delete tombstones every Extractor has already read.
+
+    The cut is the oldest tombstone watermark of the states, states without
+    the watermark do not read tombstones. Tombstones older than the retention
+    are deleted anyway, so the table does not grow while no state reads it.
+
+    Attributes:
+        pg: Writable connection with autocommit.
+        redis_settings: Redis connection settings of the Extractor states.
+        state_names: Names of the Extractor states of all the shards and the reindex.
+        retention: Max age of a tombstone in seconds.
+        interval: Time in seconds between the prunes.
+        pruned_at: Time of the last prune.
+
+    """
+
+    def __init__(
+        self,
+        pg: PGConnection,
+        redis_settings: dict,
+        state_names: Iterable[str],
+        retention: float = 7 * 24 * 3600,
+        interval: float = 600,
+    ) -> None:
+        """TombstonePruner class constructor.
+
+        Args:
+            pg: Writable connection with autocommit.
+            redis_settings: Redis connection settings of the Extractor states.
+            state_names: Names of the Extractor states of all the shards and the reindex.
+            retention: Max age of a tombstone in seconds.
+            interval: Time in seconds between the prunes.
+
+        """
+        self.pg = pg
+        self.redis_settings = redis_settings
+        self.state_names = list(state_names)
+        self.retention = retention
+        self.interval = interval
+        self.pruned_at = None
+
+    def _connect(self) -> None:
+        """Reconnect the writable connection."""
+        self.pg._connect()
+
+    def cut(self) -> datetime.datetime:
+        """Compute the time to delete the tombstones before.
+
+        Returns:
+            datetime.datetime: The oldest watermark, not older than the retention.
+
+        """
+        cut = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.retention)
+        watermarks = [
+            storage.RedisStorage(self.redis_settings, name=state_name).retrieve_state().get(TOMBSTONE_TABLE)
+            for state_name in self.state_names
+        ]
+        modified = [watermark['modified'] for watermark in watermarks if isinstance(watermark, dict)]
+        if modified:
+            cut = max(cut, min(modified))
+        return cut
+
+    @backoff_reconnect(dependency='postgres', deadline=DEADLINES['postgres'])
+    def delete(self, cut: datetime.datetime) -> int:
+        """Delete the tombstones before the time.
+
+        Args:
+            cut: Time to delete the tombstones before.
+
+        Returns:
+            int: Count of deleted tombstones.
+
+        """
+        with self.pg.connection.cursor() as cursor:
+            cursor.execute(sql_templates.delete_tombstones, {'cut': cut})
+            return cursor.rowcount
+
+    def proccess(self, force: bool = False) -> Optional[int]:
+        """Prune the tombstones once in the interval.
+
+        Args:
+            force: Prune before the interval is over.
+
+        Returns:
+            Optional[int]: Count of deleted tombstones. None: the interval is not over.
+
+        """
+        if not force and self.pruned_at is not None and monotonic() < self.pruned_at + self.interval:
+            return None
+        cut = self.cut()
+        deleted = self.delete(cut)
+        self.pruned_at = monotonic()
+        logger.info('%s tombstones before %s are deleted', deleted, cut)
+        return deleted
@@ -2,10 +2,12 @@
 
 import logging
 from logging.config import dictConfig
-from typing import Callable
+from random import random
+from typing import Callable, Iterable, Optional
 
 from lib.loggers import LOGGING
-from lib import schemas, storage
+from lib import schemas
+from lib.metrics import STAGE_LATENCY
 
 dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
@@ -14,91 +16,100 @@ logger = logging.getLogger(__name__)
 class Transformer(object):
     """Implement transform data to Elasticksearch index schema format.
 
+    The transformer keeps no state, a batch lost on crash is fetched again by the Enricher.
+
+    Documents are built directly from the query results, a sample of them is
+    validated with the pydantic schemas.
+
     Attributes:
         result_handler: Result of proccessing will return to the callable.
-        storage: Permanent storage to keep state.
-        state: State of the process
+        validate_rate: Share of documents to validate, 1 validates every document.
 
     """
 
-    def __init__(self, redis_settings: dict, result_handler: Callable) -> None:
+    def __init__(self, result_handler: Callable, validate_rate: float = 0) -> None:
         """Transformer class constructor.
 
         Args:
             result_handler: Result of the proccessing will be returned to the function.
-            redis_settings: Redis connection settings.
+            validate_rate: Share of documents to validate, 1 validates every document.
 
         """
-
-        self.storage = storage.RedisStorage(redis_settings)
-        self.state = storage.State(self.storage)
         self.result_handler = result_handler
-        self.proceed()
-
-    def proceed(self) -> None:
-        """Check the state and proceed to work if there is data in the cashe."""
-
-        if self.state.state.get('data'):
-            logger.debug('Data to proceed %s', self.state.state.get('data'))
-            self.proccess(
-                movies=self.state.state.get('data'),
-            )
+        self.validate_rate = validate_rate
 
-    def set_state(self, **kwargs) -> None:
-        """Set State in cache.
+    def bucket_persons(self, persons: list) -> dict:
+        """Split persons by role in one pass.
 
         Args:
-            kwargs: Key/value pair to save in cache.
+            persons: List of Persons with roles.
+
+        Returns:
+            dict: Directors names, actors and writers of the movie.
 
         """
-        for key, value in kwargs.items():
-            self.state.set_state(key=key, value=value)
+        buckets = {'director': [], 'actor': [], 'writer': []}
+        for person in persons:
+            bucket = buckets.get(person['role'])
+            if bucket is not None:
+                bucket.append(person)
+        return buckets
 
-    def get_person_names(self, persons: dict, played_roles: list = None) -> str:
-        """Get list of persons names.
+    def document(self, movie: dict) -> dict:
+        """Build the index document without validation.
 
         Args:
-            persons: List of Persons to extract names
-            played_roles: List of Roles to filter.
+            movie: Movie data to transform.
 
-        """
-        if played_roles:
-            return [person['name'] for person in persons if person['role'] in played_roles]
-        else:
-            return [person['name'] for person in persons]
+        Returns:
+            dict: Document in the index schema format.
 
-    def persons_by_role(self, persons: dict, played_roles: list = None) -> dict:
-        """Get list of persons info.
+        """
+        persons = self.bucket_persons(movie['persons'])
+        actors = [{'id': person['id'], 'name': person['name']} for person in persons['actor']]
+        writers = [{'id': person['id'], 'name': person['name']} for person in persons['writer']]
+        rating = movie['imdb_rating']
+        return {
+            'id': movie['id'],
+            'imdb_rating': None if rating is None else float(rating),
+            'genre': [genre for genre in movie['genre'] if genre is not None],
+            'title': movie['title'],
+            'description': movie['description'],
+            'director': [person['name'] for person in persons['director']],
+            'actors_names': [actor['name'] for actor in actors],
+            'writers_names': [writer['name'] for writer in writers],
+            'actors': actors,
+            'writers': writers,
+        }
+
+    def validated_document(self, movie: dict) -> dict:
+        """Build the index document and validate it with the schema.
 
         Args:
-            persons: List of Persons to extract names
-            played_roles: List of Roles to filter.
+            movie: Movie data to transform.
+
+        Returns:
+            dict: Document in the index schema format.
 
         """
-        if played_roles:
-            return [schemas.Person(**person).dict() for person in persons if person['role'] in played_roles]
-        else:
-            return [schemas.Person(**person).dict() for person in persons]
+        return schemas.Movie(**self.document(movie)).dict(by_alias=True)
 
-    def proccess(self, movies: list) -> None:
+    def proccess(self, movies: list, on_done: Optional[Callable] = None, deleted: Iterable[str] = ()) -> None:
         """Transform data and pass results to result_handler.
 
         Args:
             movies: movies data to transform.
+            on_done: Callback to pass to result_handler with the results.
+            deleted: Ids of the deleted movies to pass to result_handler.
 
         """
-        self.set_state(data=[movie for movie in movies])
-        for idx, movie in enumerate(movies):
-            try:
-                movies[idx] = schemas.Movie(
-                    **movies[idx],
-                    director=self.get_person_names(movie['persons'], ['director']),
-                    actors_names=self.get_person_names(movie['persons'], ['actor']),
-                    writers_names=self.get_person_names(movie['persons'], ['writer']),
-                    actors=self.persons_by_role(movie['persons'], ['actor']),
-                    writers=self.persons_by_role(movie['persons'], ['writer']),
-                ).dict(by_alias=True)
-            except Exception:
-                logger.exception('Validation data error: %s', movies[idx])
-        self.set_state(data=None)
-        self.result_handler(movies)
+        with STAGE_LATENCY.labels('transform').time():
+            for idx, movie in enumerate(movies):
+                try:
+                    if self.validate_rate and random() < self.validate_rate:
+                        movies[idx] = self.validated_document(movie)
+                    else:
+                        movies[idx] = self.document(movie)
+                except Exception:
+                    logger.exception('Validation data error: %s', movies[idx])
+        self.result_handler(movies, on_done=on_done, deleted=deleted)
@@ -0,0 +1,49 @@
+"""Tests of the AIMD batch size."""
+
+from lib.adaptive import AIMDSize
+
+
+def size(initial: int = 100) -> AIMDSize:
+    return AIMDSize(name='size', initial=initial, minimum=10, maximum=200, step=50, factor=0.5, target_latency=1)
+
+
+def test_initial_size_is_bounded():
+    assert size(initial=1).value == 10
+    assert size(initial=1000).value == 200
+
+
+def test_fast_batches_grow_additively_to_the_maximum():
+    adaptive = size()
+
+    assert adaptive.observe(0.5) == 150
+    assert adaptive.observe(0.5) == 200
+    assert adaptive.observe(0.5) == 200
+
+
+def test_slow_batch_shrinks_multiplicatively_to_the_minimum():
+    adaptive = size()
+
+    assert adaptive.observe(2) == 50
+    assert adaptive.observe(2) == 25
+    assert adaptive.observe(2) == 12
+    assert adaptive.observe(2) == 10
+    assert adaptive.observe(2) == 10
+
+
+def test_errors_shrink_a_fast_batch():
+    adaptive = size()
+
+    assert adaptive.observe(0.1, error_rate=0.01) == 50
+
+
+def test_target_latency_is_not_slow():
+    adaptive = size()
+
+    assert adaptive.observe(1) == 150
+
+
+def test_recovery_after_shrink():
+    adaptive = size()
+    adaptive.observe(2)
+
+    assert adaptive.observe(0.1) == 100
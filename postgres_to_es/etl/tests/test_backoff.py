@@ -0,0 +1,199 @@
+"""Tests of the circuit breaker and the backoff deadlines."""
+
+import pytest
+
+from database import backoff_connection
+from database.backoff_connection import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, backoff_reconnect, retry_call, skip_when_open,
+)
+
+
+class Clock(object):
+    """Fake monotonic clock moved by sleep."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(backoff_connection, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(backoff_connection, 'sleep', clock.sleep)
+    return clock
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=10)
+    monkeypatch.setitem(backoff_connection.BREAKERS, 'test', breaker)
+    return breaker
+
+
+def failing():
+    raise ConnectionError('down')
+
+
+def test_breaker_opens_on_the_threshold(breaker):
+    breaker.failure()
+    breaker.failure()
+
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+    breaker.failure()
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failures(breaker):
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+
+    assert breaker.state == CLOSED
+
+
+def test_one_probe_after_the_timeout(breaker, clock):
+    for _ in range(3):
+        breaker.failure()
+    clock.now += 9
+
+    assert not breaker.allow()
+    assert breaker.retry_after() == 1
+
+    clock.now += 1
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_probe_success_closes(breaker, clock):
+    for _ in range(3):
+        breaker.failure()
+    clock.now += 10
+    breaker.allow()
+    breaker.success()
+
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_probe_failure_opens_again(breaker, clock):
+    for _ in range(3):
+        breaker.failure()
+    clock.now += 10
+    breaker.allow()
+    breaker.failure()
+
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == 10
+
+
+def test_retry_until_success(breaker, clock):
+    results = iter([ConnectionError('down'), ConnectionError('down'), 'result'])
+
+    def flaky():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert retry_call(flaky, None, 0.1, 2, 10, 'test', None) == 'result'
+    assert breaker.state == CLOSED
+    assert len(clock.sleeps) == 2
+
+
+def test_deadline_raises_circuit_open_error(breaker, clock):
+    with pytest.raises(CircuitOpenError) as error:
+        retry_call(failing, None, 0.1, 2, 10, 'test', 30)
+
+    assert error.value.dependency == 'test'
+    assert clock.now - 1000 <= 30 + 10
+    assert breaker.state == OPEN
+
+
+def test_open_breaker_fails_without_calls(breaker, clock):
+    for _ in range(3):
+        breaker.failure()
+    calls = []
+
+    with pytest.raises(CircuitOpenError):
+        retry_call(lambda: calls.append(1), None, 0.1, 2, 10, 'test', 5)
+
+    assert calls == []
+
+
+def test_nested_circuit_open_error_is_not_retried(breaker, clock):
+    def nested():
+        raise CircuitOpenError('redis')
+
+    with pytest.raises(CircuitOpenError) as error:
+        retry_call(nested, None, 0.1, 2, 10, 'test', None)
+
+    assert error.value.dependency == 'redis'
+    assert breaker.failures == 0
+    assert clock.sleeps == []
+
+
+class Connection(object):
+    """Connection with a reconnect that fails while the dependency is down."""
+
+    def __init__(self, down: bool) -> None:
+        self.down = down
+        self.connects = 0
+        self.connected = False
+
+    def _connect(self) -> None:
+        self.connects += 1
+        if self.down:
+            raise ConnectionError('down')
+        self.connected = True
+
+    @backoff_reconnect(dependency='test', deadline=1)
+    def fetch(self) -> str:
+        if not self.connected:
+            raise ConnectionError('disconnected')
+        return 'result'
+
+
+def test_reconnect_before_the_next_try(breaker, clock):
+    connection = Connection(down=False)
+
+    assert connection.fetch() == 'result'
+    assert connection.connects == 1
+    assert breaker.state == CLOSED
+
+
+def test_failed_reconnect_counts_against_the_deadline(breaker, clock):
+    connection = Connection(down=True)
+
+    with pytest.raises(CircuitOpenError) as error:
+        connection.fetch()
+
+    assert error.value.dependency == 'test'
+    assert clock.now - 1000 <= 1 + 10
+    assert 1 <= connection.connects < 3
+    assert breaker.state == OPEN
+
+
+def test_skip_when_open_waits_for_the_probe(breaker, clock):
+    for _ in range(3):
+        breaker.failure()
+    clock.now += 4
+
+    with skip_when_open(delay=1):
+        raise CircuitOpenError('test')
+
+    assert clock.sleeps == [6]
@@ -0,0 +1,103 @@
+"""Tests of the content hash cache of the loader."""
+
+from lib.content_cache import ContentHashCache
+
+
+class FakeRedis(object):
+    """Keep Redis hashes in dicts and count the reads."""
+
+    def __init__(self) -> None:
+        self.hashes = {}
+        self.reads = 0
+
+    def hmget(self, name: str, keys: list) -> list:
+        self.reads += 1
+        return [self.hashes.get(name, {}).get(key) for key in keys]
+
+    def hset(self, name: str, mapping: dict) -> None:
+        self.hashes.setdefault(name, {}).update(mapping)
+
+    def hdel(self, name: str, *keys) -> None:
+        for key in keys:
+            self.hashes.get(name, {}).pop(key, None)
+
+    def delete(self, name: str) -> None:
+        self.hashes.pop(name, None)
+
+
+class FakeStorage(object):
+    """Storage without backoff around the fake Redis."""
+
+    def __init__(self) -> None:
+        self.name = 'hashes:movies'
+        self.redis_adapter = FakeRedis()
+
+    def try_command(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+
+def load(cache: ContentHashCache, items: list) -> list:
+    """Filter the items and remember them as loaded, like ESLoader.load."""
+    changed, digests = cache.changed(items)
+    cache.remember(digests)
+    return changed
+
+
+def test_unchanged_documents_are_skipped():
+    cache = ContentHashCache(FakeStorage())
+
+    assert load(cache, [('1', b'a'), ('2', b'b')]) == [('1', b'a'), ('2', b'b')]
+    assert load(cache, [('1', b'a'), ('2', b'c')]) == [('2', b'c')]
+    assert cache.checked == 4
+    assert cache.skipped == 1
+    assert cache.skip_rate == 0.25
+
+
+def test_not_remembered_documents_are_sent_again():
+    cache = ContentHashCache(FakeStorage())
+    changed, _ = cache.changed([('1', b'a')])
+
+    assert changed == [('1', b'a')]
+    assert cache.changed([('1', b'a')])[0] == [('1', b'a')]
+
+
+def test_digests_survive_restart():
+    storage = FakeStorage()
+    load(ContentHashCache(storage), [('1', b'a')])
+    cache = ContentHashCache(storage)
+
+    assert load(cache, [('1', b'a')]) == []
+    assert storage.redis_adapter.reads == 2
+
+
+def test_local_lru_saves_reads():
+    storage = FakeStorage()
+    cache = ContentHashCache(storage, size=1)
+    load(cache, [('1', b'a'), ('2', b'b')])
+    reads = storage.redis_adapter.reads
+
+    assert list(cache.local) == ['2']
+    assert load(cache, [('2', b'b')]) == []
+    assert storage.redis_adapter.reads == reads
+    assert load(cache, [('1', b'a')]) == []
+    assert storage.redis_adapter.reads == reads + 1
+
+
+def test_forgotten_documents_are_sent_again():
+    storage = FakeStorage()
+    cache = ContentHashCache(storage)
+    load(cache, [('1', b'a'), ('2', b'b')])
+    cache.forget(['1'])
+
+    assert '1' not in cache.local
+    assert '1' not in storage.redis_adapter.hashes[storage.name]
+    assert load(cache, [('1', b'a'), ('2', b'b')]) == [('1', b'a')]
+
+
+def test_clear_forgets_all():
+    storage = FakeStorage()
+    cache = ContentHashCache(storage)
+    load(cache, [('1', b'a')])
+    cache.clear()
+
+    assert load(cache, [('1', b'a')]) == [('1', b'a')]
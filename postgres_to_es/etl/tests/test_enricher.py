@@ -0,0 +1,100 @@
+"""Tests of the deleted film works computed by the enricher."""
+
+import pytest
+
+from lib import storage
+from processors.enricher import Enricher, missing
+from processors.extractor import MIN_ID
+
+FILM_IDS = ['a', 'b', 'c', 'd', 'e']
+
+
+class MemoryStorage(storage.BaseStorage):
+    """Keep the state and the sets in memory."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.data = {}
+        self.sets = {}
+
+    def save_state(self, state: dict, cleared=()) -> None:
+        self.data.update(state)
+        for key in cleared:
+            self.sets.pop(key, None)
+
+    def retrieve_state(self) -> dict:
+        return dict(self.data)
+
+    def add_members(self, key: str, members) -> None:
+        self.sets.setdefault(key, set()).update(members)
+
+    def members(self, key: str) -> list:
+        return sorted(self.sets.get(key, ()))
+
+
+class FakePG(object):
+    """Stream the prepared chunks of movies."""
+
+    def __init__(self, chunks: list) -> None:
+        self.chunks = chunks
+
+    def stream(self, query, **params):
+        return iter(self.chunks)
+
+
+def movies(*film_ids) -> list:
+    return [{'id': film_id} for film_id in film_ids]
+
+
+def test_missing_in_the_closed_range():
+    assert missing(FILM_IDS, MIN_ID, movies('a', 'c'), until='c') == ['b']
+
+
+def test_missing_in_the_open_range():
+    assert missing(FILM_IDS, 'c', movies('d')) == ['e']
+
+
+def test_missing_before_the_first_movie():
+    assert missing(FILM_IDS, 'a', movies('d'), until='d') == ['b', 'c']
+
+
+def test_nothing_missing():
+    assert missing(FILM_IDS, MIN_ID, movies(*FILM_IDS)) == []
+
+
+def test_all_missing_without_movies():
+    assert missing(FILM_IDS, 'b', []) == ['c', 'd', 'e']
+
+
+@pytest.fixture
+def enricher(monkeypatch):
+    monkeypatch.setattr(storage, 'RedisStorage', MemoryStorage)
+
+    def build(chunks: list) -> tuple:
+        handled = []
+
+        def result_handler(query_result, on_done=None, deleted=()):
+            handled.append(([movie['id'] for movie in query_result], list(deleted)))
+            if on_done:
+                on_done()
+
+        return Enricher(pg=FakePG(chunks), redis_settings={}, result_handler=result_handler), handled
+    return build
+
+
+def test_flush_passes_deleted_with_their_range(enricher):
+    processor, handled = enricher([movies('a'), movies('c')])
+    processor.storage.add_members('film_ids', FILM_IDS)
+    processor.flush()
+
+    assert handled == [(['a'], []), (['c'], ['b', 'd', 'e'])]
+    assert processor.state.get_state('flushing') is None
+    assert processor.storage.members('film_ids') == []
+
+
+def test_flush_deletes_all_without_movies(enricher):
+    processor, handled = enricher([])
+    processor.storage.add_members('film_ids', ['b', 'a'])
+    processor.flush()
+
+    assert handled == [([], ['a', 'b'])]
+    assert processor.state.get_state('flushing') is None
@@ -0,0 +1,73 @@
+"""Tests of the COPY output framing of the full reindex."""
+
+from processors.reindexer import COPY_DELIMITER, FullReindexer
+
+
+class FakeLoader(object):
+    """Collect bulked actions."""
+
+    def __init__(self) -> None:
+        self.bulks = []
+
+    def serialize_raw(self, doc_id: str, document: bytes) -> tuple:
+        return doc_id, document
+
+    def bulk(self, actions: list) -> list:
+        self.bulks.append(list(actions))
+        return []
+
+
+def copy_line(doc_id: str, document: str) -> bytes:
+    return doc_id.encode('utf-8') + COPY_DELIMITER + document.encode('utf-8') + b'\n'
+
+
+def reindexer(page_size: int = 1000) -> FullReindexer:
+    return FullReindexer(
+        pg=None, extractor=None, enricher=None, loader=FakeLoader(), entities=(), page_size=page_size,
+    )
+
+
+def test_lines_split_across_chunks():
+    data = copy_line('1', '{"title": "a"}') + copy_line('2', '{"title": "b"}')
+    full_reindex = reindexer()
+    for start in range(0, len(data), 5):
+        full_reindex.write(data[start:start + 5])
+    full_reindex.flush()
+
+    assert full_reindex.loader.bulks == [[('1', b'{"title": "a"}'), ('2', b'{"title": "b"}')]]
+    assert full_reindex.tail == b''
+    assert full_reindex.count == 2
+
+
+def test_incomplete_line_waits_for_the_rest():
+    full_reindex = reindexer()
+    full_reindex.write(copy_line('1', '{}') + b'2' + COPY_DELIMITER + b'{"ti')
+
+    assert full_reindex.actions == [('1', b'{}')]
+    assert full_reindex.tail == b'2' + COPY_DELIMITER + b'{"ti'
+
+    full_reindex.write(b'tle": "b"}\n')
+
+    assert full_reindex.actions == [('1', b'{}'), ('2', b'{"title": "b"}')]
+    assert full_reindex.tail == b''
+
+
+def test_delimiter_in_document_is_kept():
+    full_reindex = reindexer()
+    full_reindex.write(copy_line('1', 'a' + COPY_DELIMITER.decode('utf-8') + 'b'))
+
+    assert full_reindex.actions == [('1', b'a' + COPY_DELIMITER + b'b')]
+
+
+def test_full_pages_are_bulked():
+    full_reindex = reindexer(page_size=2)
+    full_reindex.write(b''.join(copy_line(str(doc_id), '{}') for doc_id in range(5)))
+
+    assert [len(actions) for actions in full_reindex.loader.bulks] == [5]
+    assert full_reindex.actions == []
+
+    full_reindex.write(copy_line('5', '{}'))
+    full_reindex.flush()
+
+    assert [len(actions) for actions in full_reindex.loader.bulks] == [5, 1]
+    assert full_reindex.count == 6